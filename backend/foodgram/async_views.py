@@ -0,0 +1,128 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.db import close_old_connections
+from django.http import FileResponse
+from django.urls import URLPattern
+from rest_framework.permissions import SAFE_METHODS
+
+# Сколько частей потокового ответа читается за один переход
+# в поток синхронного кода.
+STREAMING_PARTS = 100
+
+
+@functools.lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(
+        max_workers=settings.ASYNC_VIEW_THREADS,
+        thread_name_prefix='async-view'
+    )
+
+
+def call_view(view, request, *args, **kwargs):
+    # Потоки пула живут дольше запроса: соединения с БД в них
+    # проверяются так же, как на границах обычного запроса.
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render') and callable(response.render):
+            response = response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_view(view):
+    """Оборачивает синхронное представление в асинхронное.
+
+    Под ASGI Django выполняет синхронные представления по очереди
+    в одном потоке. Обёртка отдаёт безопасные запросы в ограниченный
+    пул из ASYNC_VIEW_THREADS потоков, и медленное чтение не
+    задерживает остальные. Пишущие запросы выполняются как обычно,
+    в общем потоке синхронного кода.
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in SAFE_METHODS:
+            return await sync_to_async(view)(request, *args, **kwargs)
+        loop = asyncio.get_running_loop()
+        # Контекст копируется, чтобы представление видело выбор
+        # базы для чтения, сделанный middleware.
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            get_executor(),
+            functools.partial(
+                context.run, call_view, view, request, *args, **kwargs
+            )
+        )
+    return wrapper
+
+
+class StreamingASGIHandler(ASGIHandler):
+    """ASGI-приложение, которое читает потоковые ответы вне цикла событий.
+
+    Django 3.2 перебирает потоковый ответ прямо в цикле событий, где
+    запросы к БД запрещены, а выгрузка списка покупок читает строки
+    курсором по мере отправки. Части таких ответов читаются пачками
+    по STREAMING_PARTS в потоке синхронного кода и отправляются
+    сразу; файлы отдаются как обычно.
+    """
+
+    async def send_response(self, response, send):
+        if not response.streaming or isinstance(response, FileResponse):
+            return await super().send_response(response, send)
+        # Заголовки собираются как в ASGIHandler.send_response.
+        headers = [
+            (
+                header.encode('ascii') if isinstance(header, str)
+                else header,
+                value.encode('latin1') if isinstance(value, str) else value
+            )
+            for header, value in response.items()
+        ] + [
+            (b'Set-Cookie', cookie.output(header='').encode('ascii').strip())
+            for cookie in response.cookies.values()
+        ]
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': headers,
+        })
+        parts = iter(response)
+        read = sync_to_async(
+            lambda: list(islice(parts, STREAMING_PARTS)),
+            thread_sensitive=True
+        )
+        while True:
+            batch = await read()
+            if not batch:
+                break
+            for chunk, _ in self.chunk_bytes(b''.join(batch)):
+                await send({
+                    'type': 'http.response.body',
+                    'body': chunk,
+                    'more_body': True,
+                })
+        await send({'type': 'http.response.body'})
+        await sync_to_async(response.close, thread_sensitive=True)()
+
+
+def async_patterns(urlpatterns, names):
+    """Заменяет представления маршрутов с именами из names на async."""
+    return [
+        URLPattern(
+            pattern.pattern,
+            async_view(pattern.callback),
+            pattern.default_args,
+            pattern.name
+        )
+        if isinstance(pattern, URLPattern) and pattern.name in names
+        else pattern
+        for pattern in urlpatterns
+    ]
@@ -0,0 +1,40 @@
+import psycopg2.extras
+from django.db.backends.postgresql.base import \
+    DatabaseWrapper as PostgresDatabaseWrapper
+
+from .pool import get_pool
+
+
+class DatabaseWrapper(PostgresDatabaseWrapper):
+    """Бэкенд PostgreSQL, берущий соединения из пула процесса.
+
+    Django по-прежнему закрывает соединение в конце запроса
+    (CONN_MAX_AGE=0), но закрытие возвращает его в пул,
+    и следующий запрос получает уже открытое соединение.
+    Настройки пула - в ключе POOL описания базы.
+    """
+    pool = None
+
+    def get_new_connection(self, conn_params):
+        self.pool = get_pool(
+            self.alias, conn_params, self.settings_dict.get('POOL', {})
+        )
+        connection = self.pool.checkout(conn_params)
+        # Дальше - как у PostgreSQL-бэкенда после psycopg2.connect().
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        psycopg2.extras.register_default_jsonb(
+            conn_or_curs=connection, loads=lambda x: x
+        )
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.release(self.connection)
@@ -0,0 +1,185 @@
+import os
+import threading
+import time
+from collections import deque
+
+import psycopg2
+from psycopg2 import extensions
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """Пул соединений psycopg2 одного процесса для одной базы.
+
+    Держит до MAX_SIZE соединений, ещё MAX_OVERFLOW открываются
+    при пиковой нагрузке и закрываются при возврате. Соединение
+    старше MAX_AGE пересоздаётся, простаивавшее дольше
+    CHECK_INTERVAL проверяется запросом SELECT 1 перед выдачей.
+    """
+
+    def __init__(self, alias, options):
+        self.alias = alias
+        self.max_size = options.get('MAX_SIZE', 10)
+        self.max_overflow = options.get('MAX_OVERFLOW', 5)
+        self.timeout = options.get('TIMEOUT', 5)
+        self.max_age = options.get('MAX_AGE', 600)
+        self.check_interval = options.get('CHECK_INTERVAL', 30)
+        self.condition = threading.Condition()
+        # (соединение, время создания, время возврата в пул)
+        self.idle = deque()
+        self.created_at = {}
+        self.size = 0
+        self.metrics = {
+            'checkouts': 0,
+            'created': 0,
+            'recycled': 0,
+            'health_check_failures': 0,
+            'timeouts': 0,
+            'errors': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+        }
+
+    def checkout(self, conn_params):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        while True:
+            with self.condition:
+                connection, created_at, released_at = self.take(deadline)
+            if connection is None:
+                try:
+                    connection = psycopg2.connect(**conn_params)
+                except psycopg2.Error:
+                    with self.condition:
+                        self.size -= 1
+                        self.metrics['errors'] += 1
+                        self.condition.notify()
+                    raise
+                created_at = time.monotonic()
+                with self.condition:
+                    self.metrics['created'] += 1
+            elif time.monotonic() - released_at > self.check_interval:
+                if not self.is_healthy(connection):
+                    self.discard(connection, 'health_check_failures')
+                    continue
+            waited = time.monotonic() - start
+            with self.condition:
+                self.created_at[id(connection)] = created_at
+                self.metrics['checkouts'] += 1
+                self.metrics['wait_time_total'] += waited
+                self.metrics['wait_time_max'] = max(
+                    self.metrics['wait_time_max'], waited
+                )
+            return connection
+
+    def take(self, deadline):
+        """Берёт свободное соединение или место под новое.
+
+        Вызывается под self.condition. Возвращает (None, None, None),
+        если можно открыть новое соединение.
+        """
+        while True:
+            while self.idle:
+                connection, created_at, released_at = self.idle.pop()
+                if time.monotonic() - created_at > self.max_age:
+                    self.close(connection, 'recycled')
+                    continue
+                return connection, created_at, released_at
+            if self.size < self.max_size + self.max_overflow:
+                self.size += 1
+                return None, None, None
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.metrics['timeouts'] += 1
+                raise psycopg2.OperationalError(
+                    f'Пул соединений {self.alias}: нет свободных '
+                    f'соединений за {self.timeout} с.'
+                )
+            self.condition.wait(remaining)
+
+    def release(self, connection):
+        with self.condition:
+            created_at = self.created_at.pop(id(connection), None)
+        reusable = created_at is not None and not connection.closed
+        if reusable:
+            try:
+                if (connection.info.transaction_status
+                        != extensions.TRANSACTION_STATUS_IDLE):
+                    connection.rollback()
+            except psycopg2.Error:
+                reusable = False
+        with self.condition:
+            expired = (reusable
+                       and time.monotonic() - created_at > self.max_age)
+            if reusable and not expired and self.size <= self.max_size:
+                self.idle.append((connection, created_at, time.monotonic()))
+                self.condition.notify()
+                return
+            self.close(connection, 'recycled' if expired else None)
+
+    def is_healthy(self, connection):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def discard(self, connection, metric):
+        with self.condition:
+            self.close(connection, metric)
+
+    def close(self, connection, metric=None):
+        """Закрывает соединение; вызывается под self.condition."""
+        self.size -= 1
+        if metric:
+            self.metrics[metric] += 1
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+        self.condition.notify()
+
+    def stats(self):
+        with self.condition:
+            checkouts = self.metrics['checkouts']
+            return {
+                'size': self.size,
+                'idle': len(self.idle),
+                'in_use': self.size - len(self.idle),
+                'max_size': self.max_size,
+                'max_overflow': self.max_overflow,
+                **self.metrics,
+                'wait_time_avg': (
+                    self.metrics['wait_time_total'] / checkouts
+                    if checkouts else 0.0
+                ),
+            }
+
+
+def get_pool(alias, conn_params, options):
+    """Пул процесса для базы alias с параметрами conn_params.
+
+    Ключ включает pid: после fork воркер не берёт соединения родителя.
+    """
+    key = (os.getpid(), alias, repr(sorted(conn_params.items())))
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(alias, options)
+        return _pools[key]
+
+
+def pool_metrics():
+    """Метрики всех пулов текущего процесса по имени базы."""
+    pid = os.getpid()
+    with _pools_lock:
+        pools = [
+            pool for (owner, _, _), pool in _pools.items() if owner == pid
+        ]
+    metrics = {}
+    for pool in pools:
+        metrics.setdefault(pool.alias, []).append(pool.stats())
+    return metrics
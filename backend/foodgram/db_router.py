@@ -0,0 +1,135 @@
+import asyncio
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# app_label модели таблицы DatabaseCache.
+CACHE_APP_LABEL = 'django_cache'
+STICKY_COOKIE = 'db_primary'
+STICKY_SALT = 'foodgram.db_router'
+
+# Истина, пока обрабатывается запрос, которому можно читать с реплики.
+read_from_replica = ContextVar('read_from_replica', default=False)
+# Записи текущего запроса: middleware кладёт сюда словарь, роутер
+# отмечает в нём каждую запись в основную базу.
+request_writes = ContextVar('request_writes', default=None)
+
+
+@contextmanager
+def primary():
+    """Внутри блока все чтения идут в основную базу."""
+    token = read_from_replica.set(False)
+    try:
+        yield
+    finally:
+        read_from_replica.reset(token)
+
+
+class ReplicaRouter:
+    """Отправляет чтения безопасных запросов на реплики.
+
+    Вне запросов (команды, фоновые задачи) и для пишущих запросов
+    всё идёт в основную базу. Схема реплик совпадает с основной.
+    Таблица DatabaseCache всегда в основной базе, и запись в кэш
+    не переключает клиента на чтение из неё.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == CACHE_APP_LABEL:
+            return DEFAULT_DB_ALIAS
+        if read_from_replica.get() and settings.REPLICA_DATABASES:
+            return random.choice(settings.REPLICA_DATABASES)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label == CACHE_APP_LABEL:
+            return DEFAULT_DB_ALIAS
+        writes = request_writes.get()
+        if writes is not None:
+            writes['primary'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+class ReplicaRoutingMiddleware:
+    """Выбирает базу для чтения на время запроса.
+
+    После успешного запроса, который писал в основную базу (любой
+    небезопасный метод или GET, поставивший, например, фоновую
+    задачу), клиент REPLICA_STICKY_SECONDS секунд читает из неё
+    и видит свои изменения, даже если реплика отстаёт. Срок хранится
+    в подписанной cookie, поэтому не зависит от кэша воркера.
+    Под ASGI работает асинхронно и не занимает поток.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REPLICA_DATABASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        writes, tokens = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            self.reset(tokens)
+        return self.finish(request, response, writes)
+
+    async def __acall__(self, request):
+        writes, tokens = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.reset(tokens)
+        return self.finish(request, response, writes)
+
+    def start(self, request):
+        sticky = request.get_signed_cookie(
+            STICKY_COOKIE,
+            default=None,
+            salt=STICKY_SALT,
+            max_age=settings.REPLICA_STICKY_SECONDS
+        )
+        writes = {'primary': False}
+        tokens = (
+            read_from_replica.set(
+                request.method in SAFE_METHODS and sticky is None
+            ),
+            request_writes.set(writes),
+        )
+        return writes, tokens
+
+    def reset(self, tokens):
+        read_token, writes_token = tokens
+        read_from_replica.reset(read_token)
+        request_writes.reset(writes_token)
+
+    def finish(self, request, response, writes):
+        safe = request.method in SAFE_METHODS
+        if (writes['primary'] or not safe) and response.status_code < 400:
+            response.set_signed_cookie(
+                STICKY_COOKIE,
+                '1',
+                salt=STICKY_SALT,
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                secure=request.is_secure(),
+                httponly=True,
+                samesite='Lax'
+            )
+        return response
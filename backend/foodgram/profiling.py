@@ -0,0 +1,261 @@
+import asyncio
+import heapq
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from foodgram.db.pool.pool import pool_metrics
+from rest_framework import status
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+# Верхние границы корзин гистограммы, мс; последняя корзина - всё больше.
+BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class ProfileStore:
+    """Гистограммы времени ответа по маршрутам и самые медленные запросы.
+
+    Данные хранятся в памяти процесса: у каждого воркера gunicorn
+    своя статистика.
+    """
+
+    def __init__(self, worst_size):
+        self.worst_size = worst_size
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.routes = {}
+            self.worst = []
+            self.counter = 0
+
+    def add(self, route, timings, record):
+        with self.lock:
+            stats = self.routes.setdefault(route, {
+                'count': 0,
+                'buckets': [0] * (len(BUCKETS) + 1),
+                **{name: 0.0 for name in timings},
+                'queries': 0,
+            })
+            stats['count'] += 1
+            stats['buckets'][bisect_left(BUCKETS, timings['total'])] += 1
+            for name, duration in timings.items():
+                stats[name] = stats.get(name, 0.0) + duration
+            stats['queries'] += record['queries']
+            # counter различает записи с равным временем в куче.
+            self.counter += 1
+            item = (timings['total'], self.counter, record)
+            if len(self.worst) < self.worst_size:
+                heapq.heappush(self.worst, item)
+            elif item > self.worst[0]:
+                heapq.heapreplace(self.worst, item)
+
+    def snapshot(self):
+        with self.lock:
+            routes = {}
+            for route, stats in self.routes.items():
+                count = stats['count']
+                routes[route] = {
+                    'count': count,
+                    'histogram': dict(zip(
+                        [f'<={bound}ms' for bound in BUCKETS]
+                        + [f'>{BUCKETS[-1]}ms'],
+                        stats['buckets']
+                    )),
+                    'mean_queries': round(stats['queries'] / count, 2),
+                    **{
+                        f'mean_{name}_ms': round(stats[name] / count, 2)
+                        for name in ('total', 'view', 'render', 'db')
+                    },
+                }
+            worst = [
+                record for _, _, record in sorted(self.worst, reverse=True)
+            ]
+        return {'routes': routes, 'worst': worst}
+
+
+profile_store = ProfileStore(settings.PROFILING_WORST_REQUESTS)
+
+
+class QueryRecorder:
+    """execute_wrapper: считает запросы и их суммарное время."""
+
+    def __init__(self, sql_limit):
+        self.sql_limit = sql_limit
+        self.count = 0
+        self.duration = 0.0
+        self.sql = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = (time.perf_counter() - start) * 1000
+            self.count += 1
+            self.duration += duration
+            if len(self.sql) < self.sql_limit:
+                self.sql.append({'sql': sql, 'ms': round(duration, 2)})
+
+
+# QueryRecorder текущего запроса. Переменная контекста видна и в потоке,
+# где выполняется представление, в том числе под ASGI.
+current_recorder = ContextVar('current_recorder', default=None)
+
+
+def record_queries(execute, sql, params, many, context):
+    recorder = current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_recorder(sender, connection, **kwargs):
+    """Ставит record_queries на соединение один раз за его жизнь."""
+    if record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_queries)
+
+
+def install_recorders(**kwargs):
+    for connection in connections.all():
+        install_recorder(None, connection)
+
+
+class ProfilingMiddleware:
+    """Замеряет SQL, view и рендеринг каждого запроса.
+
+    Итог отдаётся заголовком Server-Timing и копится в profile_store.
+    Включается настройкой PROFILING. Работает и в синхронном,
+    и в асинхронном режиме: под ASGI запрос не уходит ради
+    middleware в общий поток синхронного кода.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        # Соединения свои в каждом потоке: record_queries ставится
+        # на новые соединения и на уже открытые в потоке запроса.
+        connection_created.connect(install_recorder)
+        request_started.connect(install_recorders)
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+            # Синхронные хуки Django вызывал бы через sync_to_async.
+            self.process_view = self.aprocess_view
+            self.process_template_response = self.aprocess_template_response
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        recorder = QueryRecorder(settings.PROFILING_SQL_LIMIT)
+        token = current_recorder.set(recorder)
+        request.profile = {}
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_recorder.reset(token)
+        return self.finish(request, response, recorder, start)
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder(settings.PROFILING_SQL_LIMIT)
+        token = current_recorder.set(recorder)
+        request.profile = {}
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_recorder.reset(token)
+        return self.finish(request, response, recorder, start)
+
+    def finish(self, request, response, recorder, start):
+        end = time.perf_counter()
+        profile = request.profile
+        view_start = profile.get('view_start', start)
+        view_end = profile.get('view_end', end)
+        timings = {
+            'total': (end - start) * 1000,
+            'view': (view_end - view_start) * 1000,
+            'render': (profile.get('render_end', view_end) - view_end) * 1000,
+            'db': recorder.duration,
+        }
+        response['Server-Timing'] = ', '.join(
+            [
+                f'{name};dur={duration:.1f}'
+                for name, duration in timings.items() if name != 'db'
+            ]
+            + [f'db;dur={recorder.duration:.1f};desc="{recorder.count} q"']
+        )
+        match = request.resolver_match
+        route = f'{request.method} ' + (
+            f'/{match.route}' if match else 'unresolved'
+        )
+        profile_store.add(route, timings, {
+            'route': route,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'queries': recorder.count,
+            **{
+                f'{name}_ms': round(duration, 2)
+                for name, duration in timings.items()
+            },
+            'sql': recorder.sql,
+        })
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        self.view_started(request)
+
+    def process_template_response(self, request, response):
+        return self.view_finished(request, response)
+
+    async def aprocess_view(self, request, view_func, view_args,
+                            view_kwargs):
+        self.view_started(request)
+
+    async def aprocess_template_response(self, request, response):
+        return self.view_finished(request, response)
+
+    def view_started(self, request):
+        request.profile['view_start'] = time.perf_counter()
+
+    def view_finished(self, request, response):
+        request.profile['view_end'] = time.perf_counter()
+        response.add_post_render_callback(
+            lambda rendered: request.profile.update(
+                render_end=time.perf_counter()
+            )
+        )
+        return response
+
+
+class ProfilingView(APIView):
+    """Статистика профилировщика и пула соединений.
+
+    GET - показать, DELETE - сбросить статистику профилировщика.
+    """
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response({
+            'enabled': settings.PROFILING,
+            **profile_store.snapshot(),
+            'db_pool': pool_metrics(),
+        })
+
+    def delete(self, request):
+        profile_store.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
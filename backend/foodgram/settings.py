@@ -21,21 +21,25 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'djoser',
     'users.apps.UsersConfig',
     'recipes.apps.RecipesConfig',
+    'tasks.apps.TasksConfig',
     'colorfield',
     'django_filters'
 ]
 
 MIDDLEWARE = [
+    'foodgram.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'foodgram.db_router.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -66,15 +70,63 @@ WSGI_APPLICATION = 'foodgram.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': os.getenv('DB_ENGINE', 'django.db.backends.postgresql'),
         'NAME': os.getenv('POSTGRES_DB', 'django'),
         'USER': os.getenv('POSTGRES_USER', 'django'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', ''),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        'POOL': {
+            'MAX_SIZE': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+            'MAX_OVERFLOW': int(os.getenv('DB_POOL_MAX_OVERFLOW', 5)),
+            'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', 5)),
+            'MAX_AGE': int(os.getenv('DB_POOL_MAX_AGE', 600)),
+            'CHECK_INTERVAL': int(os.getenv('DB_POOL_CHECK_INTERVAL', 30)),
+        },
+    }
+}
+# Пул соединений в каждом воркере; без него соединение
+# открывается заново на каждый запрос.
+if os.getenv('DB_POOL', '').lower() == 'true':
+    DATABASES['default']['ENGINE'] = 'foodgram.db.pool'
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
     }
 }
 
+# Реплики только для чтения: DB_REPLICA_HOSTS=host1,host2:5433.
+REPLICA_DATABASES = []
+for number, address in enumerate(
+    filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), start=1
+):
+    host, _, port = address.partition(':')
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICA_DATABASES.append(f'replica{number}')
+
+# «Реплика» для тестов маршрутизации: отдельная тестовая база без
+# репликации. Вне тестов не используется, соединение не открывается.
+DATABASES['test_replica'] = {
+    **DATABASES['default'],
+    'TEST': {
+        'NAME': None
+        if DATABASES['default']['ENGINE'].endswith('sqlite3')
+        else f'test_{DATABASES["default"]["NAME"]}_replica'
+    },
+}
+
+DATABASE_ROUTERS = ['foodgram.db_router.ReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5))
+
 AUTH_USER_MODEL = 'users.MyUser'
 
 
@@ -151,6 +203,10 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Файлы пользователей вне MEDIA_ROOT, отдаются только через API.
+PRIVATE_MEDIA_ROOT = os.getenv(
+    'PRIVATE_MEDIA_ROOT', os.path.join(BASE_DIR, 'private')
+)
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
@@ -162,6 +218,52 @@ LETTERS_IN_FIELD = 200
 FIELDS_SHORT_NAME = 20
 LETTERS_IN_EMAIL = 254
 LETTERS_IN_COLOR = 7
+LETTERS_IN_STATUS = 20
 MIN_VALUE_SCORE = 1
 MAX_VALUE_SCORE = 32000
 FONT_SIZE = 14
+FONT_NAME = 'DejaVuSerif'
+FONT_FILE = 'DejaVuSerif.ttf'
+SEARCH_CONFIG = 'russian'
+INGREDIENT_INDEX_TIMEOUT = int(os.getenv('INGREDIENT_INDEX_TIMEOUT', 300))
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', 600))
+MAX_IMAGE_SIZE = int(os.getenv('MAX_IMAGE_SIZE', 5 * 1024 ** 2))
+MAX_IMAGE_PIXELS = 25_000_000
+IMAGE_SPOOL_SIZE = 1024 ** 2
+IMAGE_QUALITY = 85
+THUMBNAIL_SIZE = (480, 480)
+MAX_BATCH_RECIPES = 100
+# Рецепты авторов с большим числом подписчиков не рассылаются
+# по лентам, а подмешиваются при чтении ленты.
+FEED_PULL_THRESHOLD = int(os.getenv('FEED_PULL_THRESHOLD', 10000))
+FEED_FANOUT_BATCH = 1000
+FEED_BACKFILL = 50
+# local - пул потоков в процессе, database - очередь в БД для run_tasks,
+# eager - выполнение сразу после коммита.
+TASKS_BACKEND = os.getenv('TASKS_BACKEND', 'local')
+TASKS_LOCAL_WORKERS = int(os.getenv('TASKS_LOCAL_WORKERS', 2))
+TASKS_POLL_INTERVAL = float(os.getenv('TASKS_POLL_INTERVAL', 1))
+# Задача в работе дольше TASKS_LEASE_SECONDS считается брошенной
+# упавшим воркером и возвращается в очередь, не более
+# TASKS_MAX_ATTEMPTS попыток.
+TASKS_LEASE_SECONDS = int(os.getenv('TASKS_LEASE_SECONDS', 600))
+TASKS_MAX_ATTEMPTS = int(os.getenv('TASKS_MAX_ATTEMPTS', 3))
+# Завершённые задачи и файлы выгрузок удаляются через TASKS_RESULT_TTL
+# секунд; run_tasks проверяет это раз в TASKS_PURGE_INTERVAL секунд.
+TASKS_RESULT_TTL = int(os.getenv('TASKS_RESULT_TTL', 24 * 60 * 60))
+TASKS_PURGE_INTERVAL = 60 * 60
+# Заголовок Server-Timing и статистика /api/profiling/ для администратора.
+PROFILING = os.getenv('PROFILING', '').lower() == 'true'
+PROFILING_WORST_REQUESTS = 20
+PROFILING_SQL_LIMIT = 100
+# Под ASGI маршруты чтения выполняются в пуле из ASYNC_VIEW_THREADS потоков.
+# У каждого потока своё соединение с БД, ещё одно - у общего потока
+# синхронного кода. Поэтому по умолчанию потоков на один меньше, чем
+# соединений в пуле: при большем числе потоки ждут соединение до
+# DB_POOL_TIMEOUT.
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', '').lower() == 'true'
+ASYNC_VIEW_THREADS = int(os.getenv(
+    'ASYNC_VIEW_THREADS',
+    DATABASES['default']['POOL']['MAX_SIZE']
+    + DATABASES['default']['POOL']['MAX_OVERFLOW'] - 1
+))
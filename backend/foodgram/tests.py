@@ -0,0 +1,359 @@
+import asyncio
+import threading
+import time
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.contrib.auth import get_user_model
+from django.core.cache.backends.db import DatabaseCache
+from django.core.signals import request_finished, request_started
+from django.db import (DEFAULT_DB_ALIAS, OperationalError,
+                       close_old_connections, connection)
+from django.db.utils import load_backend
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+from recipes.models import Ingredient, Recipe, ShoppingListItem
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase
+
+from .async_views import StreamingASGIHandler, async_view
+from .db.pool.pool import _pools
+from .db_router import (ReplicaRouter, ReplicaRoutingMiddleware,
+                        read_from_replica, request_writes)
+from .profiling import ProfilingMiddleware, profile_store
+
+User = get_user_model()
+
+# Отдельная база-«реплика» без репликации из settings.DATABASES:
+# прочитанное из неё отличается от основной базы, и маршрутизацию
+# видно по ответам.
+REPLICA = 'test_replica'
+
+
+@override_settings(REPLICA_DATABASES=[REPLICA])
+class ReplicaRoutingTest(APITestCase):
+    databases = {'default', REPLICA}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            first_name='Читатель', last_name='Читателев', password='pass'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='Рецепт', text='Текст', cooking_time=10,
+            image='recipes/images/recipe.png'
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def fresh_client(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        return client
+
+    def test_safe_requests_read_from_replica(self):
+        response = self.client.get(f'/api/recipes/{self.recipe.id}/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_client_reads_own_writes_from_primary(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        response = self.client.post(f'{url}favorite/')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['is_favorited'])
+        self.assertEqual(self.fresh_client().get(url).status_code, 404)
+
+    def test_get_that_writes_makes_client_sticky(self):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/',
+            {'format': 'csv', 'async': 1}
+        )
+        self.assertEqual(response.status_code, 202)
+        url = f'/api/exports/{response.data["id"]}/'
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.fresh_client().get(url).status_code, 404)
+
+    def test_read_only_get_does_not_make_client_sticky(self):
+        self.client.get('/api/tags/')
+        response = self.client.get(f'/api/recipes/{self.recipe.id}/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_database_cache_uses_primary_without_stickiness(self):
+        model = DatabaseCache('foodgram_cache', {}).cache_model_class
+        router = ReplicaRouter()
+        writes = {'primary': False}
+        tokens = (read_from_replica.set(True), request_writes.set(writes))
+        self.addCleanup(read_from_replica.reset, tokens[0])
+        self.addCleanup(request_writes.reset, tokens[1])
+        self.assertEqual(router.db_for_read(model), DEFAULT_DB_ALIAS)
+        self.assertEqual(router.db_for_write(model), DEFAULT_DB_ALIAS)
+        self.assertFalse(writes['primary'])
+        self.assertEqual(router.db_for_read(Recipe), REPLICA)
+
+
+@override_settings(PROFILING=True)
+class ProfilingViewTest(APITestCase):
+    URL = '/api/profiling/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com',
+            first_name='Админ', last_name='Админов', password='pass'
+        )
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com',
+            first_name='Пользователь', last_name='Обычный', password='pass'
+        )
+
+    def setUp(self):
+        profile_store.reset()
+
+    def test_report_is_admin_only(self):
+        self.assertEqual(self.client.get(self.URL).status_code, 401)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(self.URL).status_code, 403)
+        self.assertEqual(self.client.delete(self.URL).status_code, 403)
+
+    def test_report_aggregates_requests_by_route(self):
+        for _ in range(2):
+            response = self.client.get('/api/tags/')
+            self.assertIn('db;dur=', response['Server-Timing'])
+        self.client.force_authenticate(self.admin)
+        report = self.client.get(self.URL).data
+        self.assertTrue(report['enabled'])
+        (route, stats), = [
+            (route, stats) for route, stats in report['routes'].items()
+            if route.startswith('GET ') and 'tags' in route
+        ]
+        self.assertEqual(stats['count'], 2)
+        self.assertEqual(sum(stats['histogram'].values()), 2)
+        self.assertGreaterEqual(stats['mean_queries'], 1)
+        self.assertEqual(len(report['worst']), 2)
+        worst = report['worst'][0]
+        self.assertEqual(
+            (worst['route'], worst['path']), (route, '/api/tags/')
+        )
+        self.assertEqual(len(worst['sql']), worst['queries'])
+        self.assertGreaterEqual(
+            worst['total_ms'], report['worst'][1]['total_ms']
+        )
+
+    def test_delete_resets_report(self):
+        self.client.get('/api/tags/')
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.client.delete(self.URL).status_code, 204)
+        # После сброса в отчёте только сам запрос DELETE.
+        report = self.client.get(self.URL).data
+        self.assertEqual(
+            [record['path'] for record in report['worst']], [self.URL]
+        )
+        self.assertEqual(len(report['routes']), 1)
+
+
+class AsyncViewTest(SimpleTestCase):
+
+    @staticmethod
+    def view(request):
+        return HttpResponse(threading.current_thread().name)
+
+    def call(self, method):
+        request = getattr(RequestFactory(), method)('/')
+        return async_to_sync(async_view(self.view))(request).content.decode()
+
+    def test_safe_requests_run_in_view_pool(self):
+        self.assertTrue(self.call('get').startswith('async-view'))
+
+    def test_unsafe_requests_bypass_view_pool(self):
+        self.assertFalse(self.call('post').startswith('async-view'))
+
+    @mock.patch('foodgram.async_views.STREAMING_PARTS', 1)
+    def test_streaming_response_is_sent_while_read(self):
+        messages = []
+
+        def content():
+            yield b'first'
+            sent = any(message.get('body') == b'first' for message in messages)
+            yield b'sent' if sent else b'buffered'
+
+        async def send(message):
+            messages.append(message)
+
+        async_to_sync(StreamingASGIHandler().send_response)(
+            StreamingHttpResponse(content()), send
+        )
+        self.assertEqual(
+            [message.get('body') for message in messages[1:]],
+            [b'first', b'sent', None]
+        )
+
+
+@override_settings(PROFILING=True, REPLICA_DATABASES=[REPLICA])
+class AsyncMiddlewareTest(TestCase):
+    databases = {'default', REPLICA}
+
+    def test_middleware_runs_natively_under_asgi(self):
+        async def get_response(request):
+            return HttpResponse()
+
+        for middleware in (ProfilingMiddleware, ReplicaRoutingMiddleware):
+            with self.subTest(middleware=middleware.__name__):
+                self.assertTrue(asyncio.iscoroutinefunction(
+                    middleware(get_response)
+                ))
+                self.assertFalse(asyncio.iscoroutinefunction(
+                    middleware(lambda request: HttpResponse())
+                ))
+
+    async def asgi_get(self, path, query_string=b'', headers=()):
+        # Как и тестовый клиент, не закрываем соединение с открытой
+        # транзакцией теста по сигналам начала и конца запроса.
+        for signal in (request_started, request_finished):
+            signal.disconnect(close_old_connections)
+            self.addCleanup(signal.connect, close_old_connections)
+        communicator = ApplicationCommunicator(StreamingASGIHandler(), {
+            'type': 'http',
+            'method': 'GET',
+            'path': path,
+            'query_string': query_string,
+            'headers': [(b'host', b'testserver'), *headers],
+        })
+        await communicator.send_input({'type': 'http.request'})
+        start = await communicator.receive_output()
+        body = b''
+        while True:
+            message = await communicator.receive_output()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                return start, body
+
+    async def test_asgi_request_is_profiled(self):
+        start, _ = await self.asgi_get('/api/tags/')
+        self.assertEqual(start['status'], 200)
+        self.assertNotIn(
+            b'desc="0 q"', dict(start['headers'])[b'Server-Timing']
+        )
+
+    @override_settings(REPLICA_DATABASES=[])
+    async def test_asgi_streams_shopping_list(self):
+        token = await sync_to_async(self.create_cart)()
+        start, body = await self.asgi_get(
+            '/api/recipes/download_shopping_cart/', b'format=txt',
+            [(b'authorization', f'Token {token}'.encode())]
+        )
+        self.assertEqual(start['status'], 200)
+        self.assertIn('Соль (г) — 5', body.decode())
+
+    @staticmethod
+    def create_cart():
+        user = User.objects.create_user(
+            username='buyer', email='buyer@example.com',
+            first_name='Покупатель', last_name='Покупателев',
+            password='pass'
+        )
+        ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        ShoppingListItem.objects.create(
+            user=user, ingredient=ingredient, amount=5
+        )
+        return Token.objects.create(user=user).key
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Пул только для PostgreSQL')
+class ConnectionPoolTest(SimpleTestCase):
+    """Бэкенд foodgram.db.pool на настоящей тестовой базе."""
+
+    def setUp(self):
+        # Свой пул на каждый тест: параметры соединения входят в ключ пула.
+        self.name = f'pool_{self._testMethodName}'
+        self.addCleanup(self.close_pool)
+
+    def close_pool(self):
+        for key, pool in list(_pools.items()):
+            if self.name in key[2]:
+                with pool.condition:
+                    while pool.idle:
+                        pool.close(pool.idle.pop()[0])
+                del _pools[key]
+
+    def make_wrapper(self, **options):
+        settings_dict = connection.settings_dict
+        return load_backend('foodgram.db.pool').DatabaseWrapper({
+            **settings_dict,
+            'OPTIONS': {
+                **settings_dict['OPTIONS'], 'application_name': self.name
+            },
+            'POOL': {**settings_dict['POOL'], **options},
+        })
+
+    def connect(self, **options):
+        wrapper = self.make_wrapper(**options)
+        wrapper.ensure_connection()
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def request(self, **options):
+        """Запрос Django: своё соединение в потоке, закрытие в конце."""
+        result = {}
+
+        def run():
+            wrapper = self.make_wrapper(**options)
+            with wrapper.cursor() as cursor:
+                cursor.execute('SELECT pg_backend_pid()')
+                result['pid'] = cursor.fetchone()[0]
+            result['pool'] = wrapper.pool
+            wrapper.close()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+        return result['pid'], result['pool']
+
+    def test_requests_reuse_released_connection(self):
+        pids = set()
+        for _ in range(3):
+            pid, pool = self.request()
+            pids.add(pid)
+        self.assertEqual(len(pids), 1)
+        stats = pool.stats()
+        self.assertEqual(stats['created'], 1)
+        self.assertEqual(stats['checkouts'], 3)
+        self.assertEqual((stats['idle'], stats['in_use']), (1, 0))
+
+    def test_overflow_connections_close_on_release(self):
+        first = self.connect(MAX_SIZE=1, MAX_OVERFLOW=1)
+        second = self.connect(MAX_SIZE=1, MAX_OVERFLOW=1)
+        self.assertIsNot(first.connection, second.connection)
+        self.assertEqual(first.pool.stats()['in_use'], 2)
+        first.close()
+        second.close()
+        stats = first.pool.stats()
+        self.assertEqual((stats['size'], stats['idle']), (1, 1))
+
+    def test_checkout_times_out_when_pool_is_exhausted(self):
+        options = {'MAX_SIZE': 1, 'MAX_OVERFLOW': 0, 'TIMEOUT': 0.1}
+        first = self.connect(**options)
+        with self.assertRaises(OperationalError):
+            self.connect(**options)
+        self.assertEqual(first.pool.stats()['timeouts'], 1)
+
+    def test_waiting_request_gets_released_connection(self):
+        options = {'MAX_SIZE': 1, 'MAX_OVERFLOW': 0, 'TIMEOUT': 5}
+        first = self.connect(**options)
+        first.inc_thread_sharing()
+        self.addCleanup(first.dec_thread_sharing)
+        timer = threading.Timer(0.1, first.close)
+        timer.start()
+        started = time.monotonic()
+        pid, pool = self.request(**options)
+        timer.join()
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
+        stats = pool.stats()
+        self.assertEqual((stats['created'], stats['checkouts']), (1, 2))
+        self.assertGreater(stats['wait_time_max'], 0)
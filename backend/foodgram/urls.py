@@ -2,7 +2,9 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
-from recipes.views import (IngredientViewSet, RecipeViewSet,
+from foodgram.async_views import async_patterns
+from foodgram.profiling import ProfilingView
+from recipes.views import (ExportViewSet, IngredientViewSet, RecipeViewSet,
                            SpecialUserViewSet, TagViewSet)
 from rest_framework import routers
 
@@ -10,6 +12,18 @@ router = routers.DefaultRouter()
 router.register(r'tags', TagViewSet, basename='tags')
 router.register(r'ingredients', IngredientViewSet, basename='ingredients')
 router.register(r'recipes', RecipeViewSet, basename='recipes')
+router.register(r'exports', ExportViewSet, basename='exports')
+
+# Маршруты чтения, которые под ASGI выполняются в пуле потоков.
+ASYNC_VIEW_NAMES = {
+    'tags-list', 'tags-detail',
+    'ingredients-list', 'ingredients-detail',
+    'recipes-list', 'recipes-detail',
+    'subscriptions',
+}
+router_urls = router.urls
+if settings.ASYNC_VIEWS:
+    router_urls = async_patterns(router_urls, ASYNC_VIEW_NAMES)
 
 urlpatterns = [
     path('api/auth/', include('djoser.urls.authtoken')),
@@ -44,10 +58,14 @@ urlpatterns = [
         'api/users/subscriptions/',
         SpecialUserViewSet.as_view({'get': 'subscriptions'}),
         name='subscriptions'),
+    path('api/profiling/', ProfilingView.as_view(), name='profiling'),
     path('admin/', admin.site.urls),
-    path('api/', include(router.urls)),
+    path('api/', include(router_urls)),
 ]
 
+if settings.ASYNC_VIEWS:
+    urlpatterns = async_patterns(urlpatterns, ASYNC_VIEW_NAMES)
+
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL,
                           document_root=settings.MEDIA_ROOT)
@@ -1,11 +1,20 @@
 from django.contrib import admin
+from django.utils import timezone
 
 from .models import (Favorite, Follow, Ingredient, Recipe, RecipeIngredient,
                      ShoppingCart, Tag)
+from .shopping_totals import shift_totals
 
 admin.site.empty_value_display = 'Не задано'
 
 
+def touch_recipes(recipe_ids):
+    """Одним запросом обновляет версию (updated_at) рецептов."""
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        updated_at=timezone.now()
+    )
+
+
 @admin.register(Follow)
 class FollowAdmin(admin.ModelAdmin):
     """Класс настройки подписок на пользователя."""
@@ -57,6 +66,7 @@ class RecipeAdmin(admin.ModelAdmin):
         'name',
         'text',
         'cooking_time',
+        'favorites_count',
     )
     list_editable = ('name', 'text', 'cooking_time')
     list_filter = ('author',)
@@ -72,6 +82,33 @@ class RecipeIngredientAdmin(admin.ModelAdmin):
         'amount',
     )
 
+    # Списки покупок корзин пересчитываются вокруг каждого изменения
+    # состава: старый состав вычитается, новый прибавляется. Версия
+    # рецепта обновляется один раз на изменение.
+    def save_model(self, request, obj, form, change):
+        recipe_ids = {obj.recipes_id}
+        if change:
+            recipe_ids.update(RecipeIngredient.objects.filter(
+                pk=obj.pk
+            ).values_list('recipes_id', flat=True))
+        shift_totals(recipe_ids, -1)
+        super().save_model(request, obj, form, change)
+        shift_totals(recipe_ids, 1)
+        touch_recipes(recipe_ids)
+
+    def delete_model(self, request, obj):
+        shift_totals([obj.recipes_id], -1)
+        super().delete_model(request, obj)
+        shift_totals([obj.recipes_id], 1)
+        touch_recipes([obj.recipes_id])
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = set(queryset.values_list('recipes_id', flat=True))
+        shift_totals(recipe_ids, -1)
+        super().delete_queryset(request, queryset)
+        shift_totals(recipe_ids, 1)
+        touch_recipes(recipe_ids)
+
 
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
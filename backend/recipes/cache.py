@@ -0,0 +1,38 @@
+import time
+
+from django.core.cache import cache
+
+GENERATION_KEY = 'recipe-repr:generation'
+
+
+def get_generation():
+    """Поколение кэша представлений рецептов.
+
+    Начальное значение берётся из времени, чтобы после вытеснения
+    ключа старые записи не стали снова действительными.
+    """
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, int(time.time()), timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_generation():
+    """Сбрасывает все закэшированные представления рецептов."""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, int(time.time()), timeout=None)
+
+
+def recipe_cache_key(recipe, request, generation):
+    """Ключ независимой от пользователя части представления рецепта.
+
+    Версией служат updated_at рецепта и его автора, адрес сайта
+    входит в ключ из-за абсолютной ссылки на картинку.
+    """
+    host = request.build_absolute_uri('/') if request else ''
+    return (f'recipe-repr:{generation}:{recipe.pk}:'
+            f'{recipe.updated_at.timestamp()}:'
+            f'{recipe.author.updated_at.timestamp()}:{host}')
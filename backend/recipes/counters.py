@@ -0,0 +1,46 @@
+from collections import Counter, defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Favorite, Follow, Recipe, ShoppingCart
+
+User = get_user_model()
+
+# Модель-источник: (модель со счётчиком, поле связи, поле счётчика).
+COUNTERS = {
+    Recipe: (User, 'author_id', 'recipes_count'),
+    Follow: (User, 'following_id', 'followers_count'),
+    Favorite: (Recipe, 'recipe_id', 'favorites_count'),
+    ShoppingCart: (Recipe, 'recipe_id', 'shopping_cart_count'),
+}
+
+
+def change_counter(sender, target_ids, delta):
+    """Атомарно изменяет счётчик на delta за каждое вхождение id.
+
+    Одинаково изменяемые объекты обновляются одним UPDATE
+    с выражением F(), счётчик не опускается ниже нуля.
+    """
+    target, _, counter = COUNTERS[sender]
+    ids_by_times = defaultdict(list)
+    for target_id, times in Counter(target_ids).items():
+        ids_by_times[times].append(target_id)
+    for times, ids in ids_by_times.items():
+        target.objects.filter(pk__in=ids).update(
+            **{counter: Greatest(F(counter) + delta * times, 0)}
+        )
+
+
+def recount(sender):
+    """Пересчитывает счётчик по фактическим строкам модели-источника."""
+    target, field, counter = COUNTERS[sender]
+    totals = sender.objects.filter(
+        **{field: OuterRef('pk')}
+    ).order_by().values(field).annotate(
+        total=Count('pk')
+    ).values('total')
+    return target.objects.update(
+        **{counter: Coalesce(Subquery(totals), 0)}
+    )
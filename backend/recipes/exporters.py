@@ -0,0 +1,182 @@
+import csv
+import json
+import tempfile
+from functools import lru_cache
+
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.units import inch
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.negotiation import BaseContentNegotiation
+
+from .models import ShoppingListItem
+
+
+@lru_cache(maxsize=None)
+def register_font():
+    """Регистрирует TTF-шрифт списка покупок один раз на процесс."""
+    pdfmetrics.registerFont(TTFont(
+        settings.FONT_NAME, settings.FONT_FILE)
+    )
+    return settings.FONT_NAME
+
+
+def shopping_list(user):
+    """Ингредиенты корзины пользователя с суммарным количеством.
+
+    Суммы поддерживаются в ShoppingListItem, выгрузка - одно чтение
+    по индексу (user, ingredient).
+    """
+    return ShoppingListItem.objects.filter(user=user).values_list(
+        'ingredient__name', 'ingredient__measurement_unit', 'amount'
+    ).order_by('ingredient__name')
+
+
+class IgnoreFormatContentNegotiation(BaseContentNegotiation):
+    """Не даёт DRF трактовать ?format= как выбор рендерера.
+
+    Параметр format у выгрузки выбирает экспортёр, а ответы
+    с ошибками отдаются первым рендерером представления.
+    """
+
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return (renderers[0], renderers[0].media_type)
+
+
+class Echo:
+    """Псевдо-файл для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListExporter:
+    """Базовый класс выгрузки списка покупок.
+
+    items - итерируемое кортежей (название, единица измерения, количество).
+    """
+    content_type = None
+    extension = None
+
+    def __init__(self, items):
+        self.items = items
+
+    @property
+    def filename(self):
+        return f'cart.{self.extension}'
+
+    def stream(self):
+        raise NotImplementedError
+
+    def render(self, file):
+        for chunk in self.stream():
+            file.write(chunk.encode())
+
+    def get_response(self):
+        response = StreamingHttpResponse(
+            self.stream(),
+            content_type=self.content_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{self.filename}"'
+        )
+        return response
+
+
+class TextExporter(ShoppingListExporter):
+    """Список покупок простым текстом, по ингредиенту на строку."""
+    content_type = 'text/plain; charset=utf-8'
+    extension = 'txt'
+
+    def stream(self):
+        for name, measurement_unit, amount in self.items:
+            yield f'{name} ({measurement_unit}) — {amount}\n'
+
+
+class CSVExporter(ShoppingListExporter):
+    """Список покупок в CSV с заголовком."""
+    content_type = 'text/csv; charset=utf-8'
+    extension = 'csv'
+
+    def stream(self):
+        writer = csv.writer(Echo())
+        yield writer.writerow(('name', 'measurement_unit', 'amount'))
+        for item in self.items:
+            yield writer.writerow(item)
+
+
+class JSONExporter(ShoppingListExporter):
+    """Список покупок JSON-массивом, собираемым по элементам."""
+    content_type = 'application/json'
+    extension = 'json'
+
+    def stream(self):
+        yield '['
+        separator = ''
+        for name, measurement_unit, amount in self.items:
+            yield separator + json.dumps(
+                {
+                    'name': name,
+                    'measurement_unit': measurement_unit,
+                    'amount': amount
+                },
+                ensure_ascii=False
+            )
+            separator = ','
+        yield ']'
+
+
+class PDFExporter(ShoppingListExporter):
+    """Список покупок в PDF с переносом строк на новые страницы.
+
+    Документ пишется во временный файл, который FileResponse
+    отдаёт клиенту частями.
+    """
+    content_type = 'application/pdf'
+    extension = 'pdf'
+
+    def render(self, buf):
+        _, height = letter
+        leading = settings.FONT_SIZE * 1.2
+        lines_per_page = int((height - 2 * inch) // leading)
+        font = register_font()
+        c = canvas.Canvas(buf, pagesize=letter, bottomup=0)
+        textob = None
+        for number, (name, measurement_unit, amount) in enumerate(
+            self.items
+        ):
+            if number % lines_per_page == 0:
+                if textob is not None:
+                    c.drawText(textob)
+                    c.showPage()
+                textob = c.beginText()
+                textob.setTextOrigin(inch, inch)
+                textob.setFont(font, settings.FONT_SIZE, leading)
+            textob.textLine(f'{name} ({measurement_unit}) — {amount}')
+        if textob is not None:
+            c.drawText(textob)
+        c.showPage()
+        c.save()
+
+    def get_response(self):
+        buf = tempfile.TemporaryFile()
+        self.render(buf)
+        buf.seek(0)
+        return FileResponse(
+            buf,
+            as_attachment=True,
+            filename=self.filename,
+            content_type=self.content_type
+        )
+
+
+EXPORTERS = {
+    exporter.extension: exporter
+    for exporter in (PDFExporter, TextExporter, CSVExporter, JSONExporter)
+}
@@ -0,0 +1,101 @@
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Q
+
+from .models import FeedEntry, Follow, Recipe
+from .shopping_totals import table
+
+User = get_user_model()
+
+
+def is_pulled(author):
+    """Рецепты автора читаются из его ленты, а не рассылаются."""
+    return author.followers_count > settings.FEED_PULL_THRESHOLD
+
+
+def fan_out(recipe):
+    """Рассылает рецепт в ленты подписчиков автора пачками."""
+    if is_pulled(recipe.author):
+        return 0
+    followers = Follow.objects.filter(
+        following_id=recipe.author_id
+    ).values_list('user_id', flat=True).order_by().iterator(
+        chunk_size=settings.FEED_FANOUT_BATCH
+    )
+    sent = 0
+    while True:
+        batch = list(islice(followers, settings.FEED_FANOUT_BATCH))
+        if not batch:
+            return sent
+        FeedEntry.objects.bulk_create(
+            [FeedEntry(user_id=user_id, recipe=recipe) for user_id in batch],
+            ignore_conflicts=True
+        )
+        sent += len(batch)
+
+
+def backfill(user, author):
+    """Добавляет в ленту последние рецепты нового автора подписки."""
+    if is_pulled(author):
+        return
+    recipe_ids = Recipe.objects.filter(author=author).order_by(
+        '-id'
+    ).values_list('id', flat=True)[:settings.FEED_BACKFILL]
+    FeedEntry.objects.bulk_create(
+        [FeedEntry(user=user, recipe_id=pk) for pk in recipe_ids],
+        ignore_conflicts=True
+    )
+
+
+def rebuild_feeds():
+    """Пересобирает ленты всех пользователей с нуля.
+
+    Как при подписке: в ленту попадают последние FEED_BACKFILL
+    рецептов каждого автора, кроме авторов, читаемых из их ленты.
+    """
+    FeedEntry.objects.all().delete()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table(FeedEntry)} (user_id, recipe_id) '
+            'SELECT follow.user_id, recipe.id '
+            f'FROM {table(Follow)} AS follow '
+            f'JOIN {table(User)} AS author '
+            'ON author.id = follow.following_id '
+            'JOIN (SELECT id, author_id, ROW_NUMBER() OVER ('
+            'PARTITION BY author_id ORDER BY id DESC) AS position '
+            f'FROM {table(Recipe)}) AS recipe '
+            'ON recipe.author_id = follow.following_id '
+            'WHERE author.followers_count <= %s '
+            'AND recipe.position <= %s',
+            [settings.FEED_PULL_THRESHOLD, settings.FEED_BACKFILL]
+        )
+        return cursor.rowcount
+
+
+def unfollow(user_id, author_id):
+    """Убирает из ленты рецепты автора, от которого отписались."""
+    FeedEntry.objects.filter(
+        user_id=user_id, recipe__author_id=author_id
+    ).delete()
+
+
+def feed_filter(user):
+    """Условие на Recipe для ленты подписок пользователя.
+
+    Разосланные рецепты берутся из FeedEntry, рецепты авторов
+    с числом подписчиков больше FEED_PULL_THRESHOLD - напрямую
+    по индексу (author, -id).
+    """
+    condition = Q(id__in=FeedEntry.objects.filter(
+        user=user
+    ).values('recipe_id'))
+    pulled = list(Follow.objects.filter(
+        user=user,
+        following__followers_count__gt=settings.FEED_PULL_THRESHOLD
+    ).values_list('following_id', flat=True))
+    if pulled:
+        condition |= Q(author_id__in=pulled)
+    return condition
@@ -1,3 +1,8 @@
+from django.conf import settings
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            TrigramSimilarity)
+from django.db import connections
+from django.db.models import Case, F, FloatField, Q, Value, When
 from django_filters import rest_framework as filters
 
 from .models import Recipe, Tag
@@ -14,6 +19,9 @@ class RecipeFilter(filters.FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart'
     )
+    search = filters.CharFilter(
+        method='filter_search'
+    )
 
     class Meta:
         model = Recipe
@@ -30,3 +38,33 @@ class RecipeFilter(filters.FilterSet):
         if value and user.is_authenticated:
             return queryset.filter(recipes_shoppingcart_related__user=user)
         return queryset
+
+    def filter_search(self, queryset, name, value):
+        """Полнотекстовый поиск по названию и описанию рецепта.
+
+        На PostgreSQL использует GIN-индексы по search_vector
+        и триграммам названия, результаты упорядочены по релевантности.
+        На остальных СУБД (SQLite в тестах) - поиск по вхождению.
+        """
+        value = value.strip()
+        if not value:
+            return queryset
+        if connections[queryset.db].vendor != 'postgresql':
+            return queryset.filter(
+                Q(name__icontains=value) | Q(text__icontains=value)
+            ).annotate(
+                rank=Case(
+                    When(name__icontains=value, then=Value(1.0)),
+                    default=Value(0.5),
+                    output_field=FloatField()
+                )
+            ).order_by('-rank', '-id')
+        query = SearchQuery(
+            value, config=settings.SEARCH_CONFIG, search_type='websearch'
+        )
+        return queryset.filter(
+            Q(search_vector=query) | Q(name__trigram_similar=value)
+        ).annotate(
+            rank=(SearchRank(F('search_vector'), query)
+                  + TrigramSimilarity('name', value))
+        ).order_by('-rank', '-id')
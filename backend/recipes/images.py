@@ -0,0 +1,143 @@
+import base64
+import binascii
+import logging
+import tempfile
+import uuid
+from pathlib import PurePath
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+from .models import Recipe
+
+# Формат Pillow: расширение файла.
+ALLOWED_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+BASE64_CHUNK = 4 * 64 * 1024
+# Поле рецепта, окончание имени файла, формат Pillow, из миниатюры ли.
+RENDITIONS = (
+    ('image_webp', '.webp', 'WEBP', False),
+    ('thumbnail', '_thumb.jpg', 'JPEG', True),
+    ('thumbnail_webp', '_thumb.webp', 'WEBP', True),
+)
+
+logger = logging.getLogger(__name__)
+
+
+def spooled_file():
+    return tempfile.SpooledTemporaryFile(
+        max_size=settings.IMAGE_SPOOL_SIZE
+    )
+
+
+def decode_base64_image(data):
+    """Декодирует картинку из data URI кусками во временный файл.
+
+    Размер проверяется до декодирования, так что в памяти не
+    появляется вторая полная копия большой картинки.
+    """
+    _, _, encoded = data.partition(';base64,')
+    if len(encoded) * 3 // 4 > settings.MAX_IMAGE_SIZE:
+        raise ValidationError(
+            'Размер картинки не должен превышать '
+            f'{settings.MAX_IMAGE_SIZE // 1024 ** 2} МБ.'
+        )
+    buffer = spooled_file()
+    try:
+        for start in range(0, len(encoded), BASE64_CHUNK):
+            buffer.write(base64.b64decode(
+                encoded[start:start + BASE64_CHUNK], validate=True
+            ))
+    except binascii.Error:
+        buffer.close()
+        raise ValidationError('Картинка передана в некорректном base64.')
+    buffer.seek(0)
+    return buffer
+
+
+def sanitize_image(file):
+    """Проверяет картинку и пересохраняет её без метаданных.
+
+    Допускаются JPEG, PNG и WebP не больше MAX_IMAGE_PIXELS пикселей;
+    EXIF-поворот применяется к изображению до удаления метаданных.
+    """
+    if getattr(file, 'size', 0) > settings.MAX_IMAGE_SIZE:
+        raise ValidationError(
+            'Размер картинки не должен превышать '
+            f'{settings.MAX_IMAGE_SIZE // 1024 ** 2} МБ.'
+        )
+    try:
+        with Image.open(file) as image:
+            if image.format not in ALLOWED_FORMATS:
+                raise ValidationError(
+                    'Допустимые форматы картинки: '
+                    f'{", ".join(ALLOWED_FORMATS)}.'
+                )
+            if image.width * image.height > settings.MAX_IMAGE_PIXELS:
+                raise ValidationError('Слишком большое разрешение картинки.')
+            image_format = image.format
+            image = ImageOps.exif_transpose(image)
+            if image_format == 'JPEG' and image.mode != 'RGB':
+                image = image.convert('RGB')
+            output = spooled_file()
+            image.save(
+                output, image_format, quality=settings.IMAGE_QUALITY
+            )
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        raise ValidationError('Не удалось прочитать картинку.')
+    output.seek(0)
+    return File(
+        output, name=f'{uuid.uuid4().hex}.{ALLOWED_FORMATS[image_format]}'
+    )
+
+
+def save_rendition(image, field, name, image_format):
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    with spooled_file() as output:
+        image.save(output, image_format, quality=settings.IMAGE_QUALITY)
+        output.seek(0)
+        field.save(name, File(output), save=False)
+
+
+def make_renditions(recipe_id):
+    """Создаёт уменьшенную копию и WebP-варианты картинки рецепта.
+
+    Варианты сохраняются независимо: ошибка одного не мешает
+    остальным, а WebP пропускается, если Pillow собран без него.
+    Файлы вариантов прежней картинки удаляются.
+    """
+    recipe = Recipe.objects.filter(pk=recipe_id).first()
+    if recipe is None or not recipe.image:
+        return
+    previous = {
+        field: getattr(recipe, field).name for field, *_ in RENDITIONS
+    }
+    stem = PurePath(recipe.image.name).stem
+    webp = features.check('webp')
+    with recipe.image.open('rb'), Image.open(recipe.image) as image:
+        image.load()
+        thumbnail = image.copy()
+        thumbnail.thumbnail(settings.THUMBNAIL_SIZE)
+        for field, suffix, image_format, small in RENDITIONS:
+            setattr(recipe, field, '')
+            if image_format == 'WEBP' and not webp:
+                continue
+            try:
+                save_rendition(
+                    thumbnail if small else image, getattr(recipe, field),
+                    stem + suffix, image_format
+                )
+            except (OSError, ValueError):
+                logger.exception('Не удалось создать %s рецепта #%s',
+                                 field, recipe_id)
+                setattr(recipe, field, '')
+    Recipe.objects.filter(pk=recipe_id).update(
+        **{field: getattr(recipe, field).name for field in previous},
+        updated_at=timezone.now()
+    )
+    for field, name in previous.items():
+        if name and name != getattr(recipe, field).name:
+            getattr(recipe, field).storage.delete(name)
@@ -0,0 +1,82 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+from .models import Ingredient
+
+
+class IngredientIndex:
+    """Индекс названий ингредиентов в памяти процесса.
+
+    Хранит отсортированный массив названий в нижнем регистре и ищет
+    по нему без обращения к базе: сначала ингредиенты, название
+    которых начинается с запроса, затем содержащие его.
+    Сбрасывается сигналами сохранения и удаления Ingredient,
+    а в других процессах устаревает через INGREDIENT_INDEX_TIMEOUT.
+    Версия индекса - число ингредиентов и самая поздняя дата
+    изменения среди них - служит ETag результатов поиска.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = None
+        self._ingredients = None
+        self._version = None
+        self._built_at = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._keys = None
+            self._ingredients = None
+            self._version = None
+
+    def _is_expired(self):
+        return (self._keys is None
+                or time.monotonic() - self._built_at
+                > settings.INGREDIENT_INDEX_TIMEOUT)
+
+    def _load(self):
+        with self._lock:
+            if self._is_expired():
+                ingredients = sorted(
+                    Ingredient.objects.all(),
+                    key=lambda ingredient: (ingredient.name.lower(),
+                                            ingredient.id)
+                )
+                self._keys = [
+                    ingredient.name.lower() for ingredient in ingredients
+                ]
+                self._ingredients = ingredients
+                self._version = (
+                    len(ingredients),
+                    max(
+                        (ingredient.updated_at for ingredient in ingredients),
+                        default=None
+                    )
+                )
+                self._built_at = time.monotonic()
+            return self._keys, self._ingredients, self._version
+
+    def version(self):
+        """(число ингредиентов, последний updated_at) в индексе."""
+        return self._load()[2]
+
+    def search(self, query):
+        query = query.lower()
+        keys, ingredients, _ = self._load()
+        prefix = []
+        for position in range(bisect_left(keys, query), len(keys)):
+            if not keys[position].startswith(query):
+                break
+            prefix.append(position)
+        found = set(prefix)
+        substring = [
+            position for position, key in enumerate(keys)
+            if position not in found and query in key
+        ]
+        return [ingredients[position] for position in prefix + substring]
+
+
+ingredient_index = IngredientIndex()
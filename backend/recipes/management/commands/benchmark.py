@@ -0,0 +1,290 @@
+import json
+import random
+import time
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.error import HTTPError
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from recipes.models import Recipe, Tag
+from rest_framework.authtoken.models import Token
+
+User = get_user_model()
+
+# Сценарий: вес в смеси запросов.
+MIX = {
+    'recipe_list': 30,
+    'recipe_list_tags': 15,
+    'recipe_detail': 25,
+    'favorite_toggle': 10,
+    'subscriptions': 10,
+    'download_cart': 10,
+}
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, rank):
+    """Перцентиль по методу ближайшего ранга."""
+    ordered = sorted(values)
+    index = max(0, -(-rank * len(ordered) // 100) - 1)
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = ('Воспроизводит смесь запросов к API в процессе или к '
+            'запущенному серверу и сообщает задержки, RPS и число '
+            'SQL-запросов на запрос. Сравнивает результат с базовым.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--warmup', type=int, default=20)
+        parser.add_argument(
+            '--url',
+            help='Адрес запущенного сервера, например '
+                 'http://127.0.0.1:8000. По умолчанию запросы идут '
+                 'в WSGI-приложение внутри процесса.'
+        )
+        parser.add_argument(
+            '--user',
+            help='Email пользователя для запросов. По умолчанию - '
+                 'первый пользователь seed_data.'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=1,
+            help='Число одновременных клиентов (только с --url).'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--baseline',
+            help='JSON-файл с базовыми результатами для сравнения.'
+        )
+        parser.add_argument(
+            '--save-baseline',
+            action='store_true',
+            help='Записать результаты в файл --baseline.'
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.2,
+            help='Допустимый рост p95 относительно базового (доля).'
+        )
+
+    def handle(self, *args, **options):
+        if options['url']:
+            return self.benchmark(options)
+        # Клиент внутри процесса обращается к testserver: без него
+        # в ALLOWED_HOSTS каждый запрос получил бы ответ 400.
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']
+        ):
+            return self.benchmark(options)
+
+    def benchmark(self, options):
+        user = self.get_user(options['user'])
+        token, _ = Token.objects.get_or_create(user=user)
+        self.rng = random.Random(options['seed'])
+        self.recipe_ids = list(
+            Recipe.objects.values_list('id', flat=True)[:1000]
+        )
+        self.tags = list(Tag.objects.values_list('slug', flat=True))
+        self.favorited = set(
+            user.recipes_favorite_related.values_list('recipe_id', flat=True)
+        )
+        if not self.recipe_ids:
+            raise CommandError('Нет рецептов: запустите seed_data.')
+        # Первые страницы списка, не больше существующих.
+        self.pages = min(10, -(-Recipe.objects.count() // (
+            settings.REST_FRAMEWORK['PAGE_SIZE']
+        )))
+        if options['url']:
+            self.send = self.http_sender(options['url'], token.key)
+        elif options['concurrency'] > 1:
+            raise CommandError('--concurrency работает только с --url.')
+        else:
+            self.send = self.client_sender(token.key)
+        scenarios = self.rng.choices(
+            list(MIX), weights=list(MIX.values()),
+            k=options['warmup'] + options['requests']
+        )
+        # Запросы строятся заранее: состояние избранного меняется
+        # в порядке сценария, даже если ответы приходят вразнобой.
+        plan = [(name, *getattr(self, name)()) for name in scenarios]
+        for item in plan[:options['warmup']]:
+            self.run_item(item)
+        start = time.perf_counter()
+        if options['concurrency'] > 1:
+            with ThreadPoolExecutor(
+                max_workers=options['concurrency']
+            ) as pool:
+                measured = list(
+                    pool.map(self.run_item, plan[options['warmup']:])
+                )
+        else:
+            # В том же потоке и соединении с базой, что и прогрев.
+            measured = [
+                self.run_item(item) for item in plan[options['warmup']:]
+            ]
+        duration = time.perf_counter() - start
+        samples = defaultdict(list)
+        for name, elapsed, queries in measured:
+            samples[name].append((elapsed, queries))
+        results = self.summarize(samples, duration)
+        self.report(results)
+        if options['baseline']:
+            self.compare(results, options)
+
+    def run_item(self, item):
+        name, method, path = item
+        status, elapsed, queries = self.send(method, path)
+        # Сценарии строятся так, чтобы все запросы были успешны: ответ
+        # с ошибкой исказил бы замер и попал бы в базовый уровень.
+        if status >= 400:
+            raise CommandError(f'{method} {path}: ответ {status}.')
+        return name, elapsed, queries
+
+    def get_user(self, email):
+        users = User.objects.all()
+        if email:
+            users = users.filter(email=email)
+        else:
+            users = users.filter(username__startswith='bench')
+        user = users.order_by('id').first()
+        if user is None:
+            raise CommandError('Пользователь не найден: запустите seed_data.')
+        return user
+
+    def client_sender(self, token):
+        client = Client(HTTP_AUTHORIZATION=f'Token {token}')
+
+        def send(method, path):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = getattr(client, method)(path)
+                # Ответ закрывает сам тестовый клиент, для потокового -
+                # после чтения содержимого.
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                elapsed = time.perf_counter() - started
+            return response.status_code, elapsed, len(queries)
+        return send
+
+    def http_sender(self, url, token):
+        def send(method, path):
+            request = urllib.request.Request(
+                url.rstrip('/') + path,
+                method=method.upper(),
+                headers={'Authorization': f'Token {token}'}
+            )
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request) as response:
+                    response.read()
+                    status = response.status
+            except HTTPError as error:
+                status = error.code
+            return status, time.perf_counter() - started, None
+        return send
+
+    def recipe_list(self):
+        return 'get', f'/api/recipes/?page={self.rng.randint(1, self.pages)}'
+
+    def recipe_list_tags(self):
+        tags = '&'.join(
+            f'tags={slug}' for slug in self.rng.sample(
+                self.tags, min(2, len(self.tags))
+            )
+        )
+        return 'get', f'/api/recipes/?{tags}'
+
+    def recipe_detail(self):
+        return 'get', f'/api/recipes/{self.rng.choice(self.recipe_ids)}/'
+
+    def favorite_toggle(self):
+        recipe_id = self.rng.choice(self.recipe_ids)
+        if recipe_id in self.favorited:
+            self.favorited.discard(recipe_id)
+            return 'delete', f'/api/recipes/{recipe_id}/favorite/'
+        self.favorited.add(recipe_id)
+        return 'post', f'/api/recipes/{recipe_id}/favorite/'
+
+    def subscriptions(self):
+        return 'get', '/api/users/subscriptions/?recipes_limit=3'
+
+    def download_cart(self):
+        return 'get', '/api/recipes/download_shopping_cart/?format=txt'
+
+    def summarize(self, samples, duration):
+        results = {}
+        everything = []
+        for name, values in sorted(samples.items()):
+            everything.extend(values)
+            results[name] = self.summary(values)
+        results['total'] = self.summary(everything)
+        results['total']['rps'] = round(len(everything) / duration, 1)
+        return results
+
+    def summary(self, values):
+        latencies = [elapsed * 1000 for elapsed, _ in values]
+        queries = [count for _, count in values if count is not None]
+        summary = {'count': len(values)}
+        for rank in PERCENTILES:
+            summary[f'p{rank}'] = round(percentile(latencies, rank), 2)
+        summary['queries'] = (
+            round(sum(queries) / len(queries), 1) if queries else None
+        )
+        return summary
+
+    def report(self, results):
+        self.stdout.write(
+            f'{"сценарий":<20}{"n":>6}{"p50 мс":>10}{"p95 мс":>10}'
+            f'{"p99 мс":>10}{"SQL":>8}'
+        )
+        for name, summary in results.items():
+            queries = summary['queries']
+            self.stdout.write(
+                f'{name:<20}{summary["count"]:>6}{summary["p50"]:>10}'
+                f'{summary["p95"]:>10}{summary["p99"]:>10}'
+                f'{"-" if queries is None else queries:>8}'
+            )
+        self.stdout.write(f'RPS: {results["total"]["rps"]}')
+
+    def compare(self, results, options):
+        path = Path(options['baseline'])
+        if options['save_baseline']:
+            path.write_text(json.dumps(results, indent=2), encoding='utf-8')
+            self.stdout.write(self.style.SUCCESS(f'Базовый уровень: {path}.'))
+            return
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден.')
+        baseline = json.loads(path.read_text(encoding='utf-8'))
+        regressions = []
+        for name, summary in results.items():
+            base = baseline.get(name)
+            if base is None:
+                continue
+            if summary['p95'] > base['p95'] * (1 + options['tolerance']):
+                regressions.append(
+                    f'{name}: p95 {base["p95"]} -> {summary["p95"]} мс'
+                )
+            if (summary['queries'] is not None
+                    and base['queries'] is not None
+                    and summary['queries'] > base['queries']):
+                regressions.append(
+                    f'{name}: SQL {base["queries"]} -> {summary["queries"]}'
+                )
+        if regressions:
+            raise CommandError(
+                'Регрессия относительно базового уровня:\n'
+                + '\n'.join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS('Регрессий нет.'))
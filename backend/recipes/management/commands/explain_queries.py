@@ -0,0 +1,148 @@
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models.query import RawQuerySet
+from recipes.exporters import shopping_list
+from recipes.feed import feed_filter
+from recipes.filters import RecipeFilter
+from recipes.models import Favorite, Follow, Recipe, ShoppingCart, Tag
+from recipes.views import RecipeViewSet, SpecialUserViewSet, latest_recipes
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Строит EXPLAIN горячих запросов на заполненной базе '
+            'PostgreSQL и завершается ошибкой, если в плане есть '
+            'последовательное сканирование таблицы.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            help='Email пользователя, от имени которого строятся запросы. '
+                 'По умолчанию - пользователь с непустой корзиной.'
+        )
+        parser.add_argument(
+            '--plans',
+            action='store_true',
+            help='Вывести планы всех запросов.'
+        )
+        parser.add_argument(
+            '--database',
+            default=DEFAULT_DB_ALIAS,
+        )
+
+    def handle(self, *args, **options):
+        database = options['database']
+        connection = connections[database]
+        if connection.vendor != 'postgresql':
+            raise CommandError(
+                'Проверка планов доступна только на PostgreSQL.'
+            )
+        user = self.get_user(options['user'])
+        failures = []
+        with transaction.atomic(using=database):
+            plans = self.explain(connection, user)
+        for name, plan in plans.items():
+            scans = [line.strip() for line in plan if 'Seq Scan' in line]
+            if options['plans']:
+                self.stdout.write(f'{name}:\n' + '\n'.join(plan) + '\n')
+            if scans:
+                failures.append(f'{name}: {"; ".join(scans)}')
+            else:
+                self.stdout.write(f'{name}: OK')
+        if failures:
+            raise CommandError(
+                'Последовательное сканирование в планах:\n'
+                + '\n'.join(failures)
+            )
+        self.stdout.write(self.style.SUCCESS('Все планы используют индексы.'))
+
+    def explain(self, connection, user):
+        """Планы горячих запросов: имя запроса -> строки EXPLAIN.
+
+        Вызывается в транзакции: SET LOCAL действует до её конца.
+        Без enable_seqscan планировщик выбирает Seq Scan только там,
+        где подходящего индекса нет: на маленькой тестовой базе
+        иначе он предпочёл бы сканирование и с индексом.
+        """
+        plans = {}
+        with connection.cursor() as c:
+            c.execute('SET LOCAL enable_seqscan = off')
+            for name, query in self.hot_queries(user).items():
+                if isinstance(query, RawQuerySet):
+                    sql, params = query.raw_query, query.params
+                else:
+                    sql, params = query.query.sql_with_params()
+                c.execute(f'EXPLAIN {sql}', params)
+                plans[name] = [row[0] for row in c.fetchall()]
+        return plans
+
+    def get_user(self, email):
+        if email:
+            user = User.objects.filter(email=email).first()
+        else:
+            user = User.objects.filter(
+                recipes_shoppingcart_related__isnull=False
+            ).first()
+        if user is None:
+            raise CommandError(
+                'Нет пользователя с корзиной: заполните базу '
+                'или укажите --user.'
+            )
+        return user
+
+    def recipe_list(self, request, data):
+        view = RecipeViewSet(request=request, action='list', kwargs={})
+        return RecipeFilter(
+            data=data, queryset=view.get_queryset(), request=request
+        ).qs[:settings.REST_FRAMEWORK['PAGE_SIZE']]
+
+    def hot_queries(self, user):
+        """Запросы в том виде, в каком их строят представления."""
+        request = SimpleNamespace(user=user, query_params={})
+        page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+        tags = list(Tag.objects.values_list('slug', flat=True)[:2])
+        authors = list(
+            Follow.objects.filter(user=user).values_list(
+                'following_id', flat=True
+            )[:page_size]
+        ) or [user.id]
+        recipe = ShoppingCart.objects.filter(user=user).values_list(
+            'recipe_id', flat=True
+        ).first()
+        subscriptions = SpecialUserViewSet(
+            request=request, action='subscriptions', kwargs={}
+        )
+        return {
+            'recipe_list': self.recipe_list(request, {}),
+            'recipe_list_tags': self.recipe_list(request, {'tags': tags}),
+            'recipe_list_author': self.recipe_list(
+                request, {'author': authors[0]}
+            ),
+            'recipe_list_favorited': self.recipe_list(
+                request, {'is_favorited': True}
+            ),
+            'recipe_list_in_cart': self.recipe_list(
+                request, {'is_in_shopping_cart': True}
+            ),
+            'feed': RecipeViewSet(
+                request=request, action='feed', kwargs={}
+            ).get_queryset().filter(
+                feed_filter(user)
+            ).order_by('-id')[:page_size],
+            'subscriptions': subscriptions.get_queryset().filter(
+                followers__user=user
+            )[:page_size],
+            'subscription_recipes': latest_recipes(authors, 3),
+            'shopping_list': shopping_list(user),
+            'favorite_check': Favorite.objects.filter(
+                user=user, recipe_id=recipe
+            ).values('id')[:1],
+            'recipe_counters': Recipe.objects.filter(
+                id=recipe
+            ).values('favorites_count', 'shopping_cart_count'),
+        }
@@ -0,0 +1,100 @@
+import json
+import sys
+from collections import defaultdict
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+from recipes.models import Recipe, RecipeIngredient
+
+IMAGE_FIELDS = ('image', 'image_webp', 'thumbnail', 'thumbnail_webp')
+
+
+class Command(BaseCommand):
+    help = ('Выгружает рецепты с тегами, ингредиентами и путями картинок '
+            'в NDJSON: один рецепт в строке.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default='-',
+            help='Файл .ndjson, по умолчанию стандартный вывод.'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Сколько рецептов читать из курсора за раз.'
+        )
+        parser.add_argument(
+            '--database',
+            default=DEFAULT_DB_ALIAS,
+        )
+
+    def handle(self, *args, **options):
+        if options['path'] == '-':
+            exported = self.export(sys.stdout, options)
+        else:
+            with open(options['path'], 'w', encoding='utf-8') as file:
+                exported = self.export(file, options)
+        self.stderr.write(self.style.SUCCESS(
+            f'Выгружено рецептов: {exported}.'
+        ))
+
+    def export(self, file, options):
+        database = options['database']
+        chunk_size = options['chunk_size']
+        recipes = Recipe.objects.using(database).select_related(
+            'author'
+        ).only(
+            'id', 'name', 'text', 'cooking_time', 'author__email',
+            *IMAGE_FIELDS
+        ).order_by('id').iterator(chunk_size=chunk_size)
+        exported = 0
+        while True:
+            chunk = list(islice(recipes, chunk_size))
+            if not chunk:
+                return exported
+            tags, ingredients = self.load_relations(database, chunk)
+            for recipe in chunk:
+                file.write(json.dumps(
+                    {
+                        'author': recipe.author.email,
+                        'name': recipe.name,
+                        'text': recipe.text,
+                        'cooking_time': recipe.cooking_time,
+                        **{
+                            field: getattr(recipe, field).name or None
+                            for field in IMAGE_FIELDS
+                        },
+                        'tags': tags[recipe.id],
+                        'ingredients': ingredients[recipe.id],
+                    },
+                    ensure_ascii=False
+                ) + '\n')
+            exported += len(chunk)
+
+    def load_relations(self, database, chunk):
+        """Теги и ингредиенты пачки рецептов двумя запросами."""
+        ids = [recipe.id for recipe in chunk]
+        tags = defaultdict(list)
+        for recipe_id, slug in Recipe.tags.through.objects.using(
+            database
+        ).filter(recipe_id__in=ids).values_list('recipe_id', 'tag__slug'):
+            tags[recipe_id].append(slug)
+        ingredients = defaultdict(list)
+        for recipe_id, name, measurement_unit, amount in (
+            RecipeIngredient.objects.using(database).filter(
+                recipes_id__in=ids
+            ).order_by('id').values_list(
+                'recipes_id', 'ingredients__name',
+                'ingredients__measurement_unit', 'amount'
+            )
+        ):
+            ingredients[recipe_id].append({
+                'name': name,
+                'measurement_unit': measurement_unit,
+                'amount': amount,
+            })
+        return tags, ingredients
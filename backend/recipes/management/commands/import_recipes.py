@@ -0,0 +1,161 @@
+import json
+import sys
+import time
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from recipes.cache import bump_generation
+from recipes.counters import change_counter
+from recipes.ingredient_index import ingredient_index
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+
+User = get_user_model()
+
+IMAGE_FIELDS = ('image', 'image_webp', 'thumbnail', 'thumbnail_webp')
+
+
+class Command(BaseCommand):
+    help = ('Загружает рецепты из NDJSON, выгруженного export_recipes. '
+            'Каждая пачка записывается в отдельной транзакции.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default='-',
+            help='Файл .ndjson, по умолчанию стандартный ввод.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько рецептов записывать в одной транзакции.'
+        )
+        parser.add_argument(
+            '--database',
+            default=DEFAULT_DB_ALIAS,
+        )
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        if options['path'] == '-':
+            imported = self.load(sys.stdin, options)
+        else:
+            try:
+                with open(options['path'], encoding='utf-8') as file:
+                    imported = self.load(file, options)
+            except FileNotFoundError:
+                raise CommandError(f'Файл {options["path"]} не найден.')
+        elapsed = max(time.monotonic() - start, 1e-6)
+        ingredient_index.invalidate()
+        bump_generation()
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено {imported} рецептов за {elapsed:.2f} с '
+            f'({imported / elapsed:.0f} рецептов/с).'
+        ))
+
+    def load(self, file, options):
+        database = options['database']
+        lines = enumerate(file, start=1)
+        imported = 0
+        while True:
+            batch = list(islice(lines, options['batch_size']))
+            if not batch:
+                return imported
+            rows = []
+            for number, line in batch:
+                if not line.strip():
+                    continue
+                try:
+                    rows.append(json.loads(line))
+                except ValueError as error:
+                    raise CommandError(f'Строка {number}: {error}')
+            try:
+                with transaction.atomic(using=database):
+                    self.import_batch(database, rows)
+            except KeyError as error:
+                raise CommandError(
+                    f'Строки {batch[0][0]}-{batch[-1][0]}: '
+                    f'нет значения {error}'
+                )
+            imported += len(rows)
+
+    def import_batch(self, database, rows):
+        """Записывает пачку рецептов фиксированным числом запросов."""
+        authors = self.resolve(
+            User.objects.using(database),
+            {row['author'] for row in rows},
+            'email', 'Нет пользователей'
+        )
+        tags = self.resolve(
+            Tag.objects.using(database),
+            {slug for row in rows for slug in row['tags']},
+            'slug', 'Нет тегов'
+        )
+        ingredients = self.ingredients(database, rows)
+        recipes = [
+            Recipe(
+                author=authors[row['author']],
+                name=row['name'],
+                text=row['text'],
+                cooking_time=row['cooking_time'],
+                **{field: row.get(field) or '' for field in IMAGE_FIELDS}
+            )
+            for row in rows
+        ]
+        connection = connections[database]
+        if connection.features.can_return_rows_from_bulk_insert:
+            Recipe.objects.using(database).bulk_create(recipes)
+            change_counter(Recipe, [recipe.author_id for recipe in recipes], 1)
+        else:
+            # Без RETURNING bulk_create не заполняет id, а они нужны
+            # для связей; save() сам обновляет счётчик рецептов автора.
+            for recipe in recipes:
+                recipe.save(using=database)
+        Recipe.tags.through.objects.using(database).bulk_create([
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=tags[slug].id)
+            for recipe, row in zip(recipes, rows)
+            for slug in dict.fromkeys(row['tags'])
+        ])
+        RecipeIngredient.objects.using(database).bulk_create([
+            RecipeIngredient(
+                recipes=recipe,
+                ingredients=ingredients[
+                    (item['name'], item['measurement_unit'])
+                ],
+                amount=item['amount']
+            )
+            for recipe, row in zip(recipes, rows)
+            for item in row['ingredients']
+        ])
+
+    def resolve(self, queryset, values, field_name, message):
+        objects = queryset.in_bulk(values, field_name=field_name)
+        missing = values - objects.keys()
+        if missing:
+            raise CommandError(f'{message}: {", ".join(sorted(missing))}.')
+        return objects
+
+    def ingredients(self, database, rows):
+        """Находит ингредиенты пачки, недостающие создаются."""
+        keys = {
+            (item['name'], item['measurement_unit'])
+            for row in rows for item in row['ingredients']
+        }
+        queryset = Ingredient.objects.using(database)
+        queryset.bulk_create(
+            [
+                Ingredient(name=name, measurement_unit=measurement_unit)
+                for name, measurement_unit in keys
+            ],
+            ignore_conflicts=True
+        )
+        return {
+            (ingredient.name, ingredient.measurement_unit): ingredient
+            for ingredient in queryset.filter(
+                name__in={name for name, _ in keys}
+            )
+            if (ingredient.name, ingredient.measurement_unit) in keys
+        }
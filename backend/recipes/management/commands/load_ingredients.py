@@ -0,0 +1,115 @@
+import csv
+import io
+import json
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from recipes.ingredient_index import ingredient_index
+from recipes.models import Ingredient
+
+
+class Command(BaseCommand):
+    help = ('Загружает ингредиенты из CSV или JSON. '
+            'Повторный запуск не создаёт дубликатов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=str(settings.CUR_DIR / 'data' / 'ingredients.csv'),
+            help='Файл .csv (название,единица) или .json.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Размер пачки bulk_create для СУБД без COPY.'
+        )
+        parser.add_argument(
+            '--database',
+            default=DEFAULT_DB_ALIAS,
+        )
+
+    def handle(self, *args, **options):
+        rows = self.read_rows(Path(options['path']))
+        database = options['database']
+        connection = connections[database]
+        start = time.monotonic()
+        with transaction.atomic(using=database):
+            if connection.vendor == 'postgresql':
+                created = self.copy_rows(connection, rows)
+            else:
+                created = self.bulk_create_rows(
+                    database, rows, options['batch_size']
+                )
+        elapsed = max(time.monotonic() - start, 1e-6)
+        ingredient_index.invalidate()
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано {len(rows)} строк, добавлено {created} '
+            f'за {elapsed:.2f} с ({len(rows) / elapsed:.0f} строк/с).'
+        ))
+
+    def read_rows(self, path):
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден.')
+        with open(path, encoding='utf-8') as file:
+            if path.suffix == '.json':
+                rows = [
+                    (item['name'], item['measurement_unit'])
+                    for item in json.load(file)
+                ]
+            elif path.suffix == '.csv':
+                rows = [tuple(row[:2]) for row in csv.reader(file) if row]
+            else:
+                raise CommandError('Поддерживаются только .csv и .json.')
+        return list(dict.fromkeys(
+            (name.strip(), measurement_unit.strip())
+            for name, measurement_unit in rows
+        ))
+
+    def copy_rows(self, connection, rows):
+        """Загружает строки через COPY во временную таблицу.
+
+        Из неё ингредиенты переносятся одним INSERT ... ON CONFLICT,
+        уже существующие пары (название, единица) пропускаются.
+        Таблица удаляется сразу, а не при COMMIT: команда может
+        выполняться внутри внешней транзакции.
+        """
+        table = connection.ops.quote_name(Ingredient._meta.db_table)
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredient_load '
+                '(name varchar(200), measurement_unit varchar(200))'
+            )
+            cursor.copy_expert(
+                'COPY ingredient_load (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)',
+                buffer
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit, updated_at) '
+                'SELECT name, measurement_unit, now() FROM ingredient_load '
+                'ON CONFLICT (name, measurement_unit) DO NOTHING'
+            )
+            created = cursor.rowcount
+            cursor.execute('DROP TABLE ingredient_load')
+            return created
+
+    def bulk_create_rows(self, database, rows, batch_size):
+        ingredients = Ingredient.objects.using(database)
+        count = ingredients.count()
+        ingredients.bulk_create(
+            [
+                Ingredient(name=name, measurement_unit=measurement_unit)
+                for name, measurement_unit in rows
+            ],
+            batch_size=batch_size,
+            ignore_conflicts=True
+        )
+        return ingredients.count() - count
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.counters import COUNTERS, recount
+from recipes.shopping_totals import rebuild_totals
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики рецептов, подписчиков, '
+            'избранного и корзины и списки покупок по фактическим данным.')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        for sender, (target, _, counter) in COUNTERS.items():
+            updated = recount(sender)
+            self.stdout.write(
+                f'{target._meta.verbose_name_plural}.{counter}: '
+                f'пересчитано {updated}'
+            )
+        self.stdout.write(
+            f'Строк списков покупок: {rebuild_totals()}'
+        )
+        self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны.'))
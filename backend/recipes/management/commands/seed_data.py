@@ -0,0 +1,164 @@
+import io
+import random
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from PIL import Image
+from recipes.cache import bump_generation
+from recipes.counters import COUNTERS, recount
+from recipes.feed import rebuild_feeds
+from recipes.ingredient_index import ingredient_index
+from recipes.models import (Favorite, Follow, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, Tag)
+from recipes.shopping_totals import rebuild_totals
+
+User = get_user_model()
+
+SEED_PASSWORD = 'benchmark'
+SEED_IMAGE = 'recipes/images/benchmark.jpg'
+SEED_TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими пользователями, рецептами, '
+            'подписками и лентами, избранным и корзинами для нагрузочных '
+            'тестов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--follows', type=int, default=10)
+        parser.add_argument('--favorites', type=int, default=20)
+        parser.add_argument('--cart', type=int, default=5)
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Зерно генератора: одинаковые параметры дают '
+                 'одинаковый набор данных.'
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        tags = self.seed_tags()
+        ingredients = self.seed_ingredients(
+            options['ingredients_per_recipe']
+        )
+        users = self.seed_users(options['users'])
+        recipes = self.seed_recipes(rng, users, options['recipes'])
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=tag.id)
+            for recipe in recipes
+            for tag in rng.sample(tags, rng.randint(1, len(tags)))
+        ])
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(
+                recipes=recipe,
+                ingredients=ingredient,
+                amount=rng.randint(1, 500)
+            )
+            for recipe in recipes
+            for ingredient in rng.sample(
+                ingredients,
+                min(options['ingredients_per_recipe'], len(ingredients))
+            )
+        ], batch_size=5000)
+        for model, per_user, population in (
+            (Follow, options['follows'], users),
+            (Favorite, options['favorites'], recipes),
+            (ShoppingCart, options['cart'], recipes),
+        ):
+            self.seed_links(rng, model, users, population, per_user)
+        for sender in COUNTERS:
+            recount(sender)
+        rebuild_totals()
+        rebuild_feeds()
+        ingredient_index.invalidate()
+        bump_generation()
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(users)}, рецептов: '
+            f'{len(recipes)}. Пароль пользователей: {SEED_PASSWORD}.'
+        ))
+
+    def seed_tags(self):
+        for name, color, slug in SEED_TAGS:
+            Tag.objects.get_or_create(
+                slug=slug, defaults={'name': name, 'color': color}
+            )
+        return list(Tag.objects.all())
+
+    def seed_ingredients(self, minimum):
+        missing = minimum - Ingredient.objects.count()
+        if missing > 0:
+            Ingredient.objects.bulk_create(
+                [
+                    Ingredient(name=f'Ингредиент {number}',
+                               measurement_unit='г')
+                    for number in range(missing)
+                ],
+                ignore_conflicts=True
+            )
+        return list(Ingredient.objects.only('id'))
+
+    def seed_users(self, count):
+        start = User.objects.count()
+        password = make_password(SEED_PASSWORD)
+        User.objects.bulk_create([
+            User(
+                username=f'bench{number}',
+                email=f'bench{number}@example.com',
+                first_name='Bench',
+                last_name=str(number),
+                password=password
+            )
+            for number in range(start, start + count)
+        ])
+        return list(User.objects.filter(
+            username__in=[f'bench{n}' for n in range(start, start + count)]
+        ))
+
+    def seed_recipes(self, rng, users, count):
+        if not default_storage.exists(SEED_IMAGE):
+            buffer = io.BytesIO()
+            Image.new('RGB', (640, 480), '#E26C2D').save(buffer, 'JPEG')
+            default_storage.save(SEED_IMAGE, ContentFile(buffer.getvalue()))
+        recipes = [
+            Recipe(
+                author=rng.choice(users),
+                name=f'Рецепт {number}',
+                text=f'Описание синтетического рецепта {number}.',
+                cooking_time=rng.randint(5, 180),
+                image=SEED_IMAGE
+            )
+            for number in range(count)
+        ]
+        if connection.features.can_return_rows_from_bulk_insert:
+            return Recipe.objects.bulk_create(recipes, batch_size=5000)
+        for recipe in recipes:
+            recipe.save()
+        return recipes
+
+    def seed_links(self, rng, model, users, population, per_user):
+        field = 'following' if model is Follow else 'recipe'
+        model.objects.bulk_create(
+            [
+                model(user=user, **{field: target})
+                for user in users
+                for target in rng.sample(
+                    population, min(per_user, len(population))
+                )
+                if target != user
+            ],
+            batch_size=5000,
+            ignore_conflicts=True
+        )
@@ -0,0 +1,45 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('Recipe', 'users', 'MyUser', 'author', 'recipes_count'),
+    ('Follow', 'users', 'MyUser', 'following', 'followers_count'),
+    ('Favorite', 'recipes', 'Recipe', 'recipe', 'favorites_count'),
+    ('ShoppingCart', 'recipes', 'Recipe', 'recipe', 'shopping_cart_count'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for source, app_label, target, field, counter in COUNTERS:
+        source_model = apps.get_model('recipes', source)
+        totals = source_model.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            total=Count('pk')
+        ).values('total')
+        apps.get_model(app_label, target).objects.update(
+            **{counter: Coalesce(Subquery(totals), 0)}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_myuser_counters'),
+        ('recipes', '0005_ingredient_unique_ingredient'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавлений в избранное'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавлений в корзину'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
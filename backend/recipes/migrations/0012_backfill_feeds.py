@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def backfill_feeds(apps, schema_editor):
+    Follow = apps.get_model('recipes', 'Follow')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    FeedEntry = apps.get_model('recipes', 'FeedEntry')
+    authors = Follow.objects.filter(
+        following__followers_count__lte=settings.FEED_PULL_THRESHOLD
+    ).order_by().values_list('following_id', flat=True).distinct()
+    for author_id in authors.iterator():
+        recipe_ids = list(Recipe.objects.filter(
+            author_id=author_id
+        ).order_by('-id').values_list('id', flat=True)[
+            :settings.FEED_BACKFILL
+        ])
+        followers = Follow.objects.filter(
+            following_id=author_id
+        ).values_list('user_id', flat=True)
+        FeedEntry.objects.bulk_create(
+            [
+                FeedEntry(user_id=user_id, recipe_id=recipe_id)
+                for user_id in followers.iterator()
+                for recipe_id in recipe_ids
+            ],
+            batch_size=5000,
+            ignore_conflicts=True
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_feedentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_feeds, migrations.RunPython.noop),
+    ]
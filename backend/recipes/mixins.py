@@ -0,0 +1,102 @@
+import hashlib
+from urllib.parse import urlencode
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+
+
+class ConditionalGetMixin:
+    """Условные GET-запросы (ETag / Last-Modified) для list и retrieve.
+
+    Версия ответа вычисляется дешёвым запросом до сериализации:
+    при совпадении If-None-Match или If-Modified-Since клиент
+    получает 304 без запуска сериализатора.
+    """
+    vary_on_user = False
+    # Связи, чья дата изменения updated_at тоже входит в версию:
+    # например, автор в представлении рецепта.
+    version_lookups = ()
+
+    def get_version(self):
+        """Возвращает (etag, last_modified) текущего ответа или None.
+
+        По умолчанию версия - число объектов и самые поздние
+        даты изменения updated_at объектов выборки и связей из
+        version_lookups; для списка выборка учитывает фильтры,
+        а в ETag входят параметры запроса.
+        """
+        queryset = self.get_queryset()
+        if self.action == 'retrieve':
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            try:
+                queryset = queryset.filter(
+                    **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+                )
+            except (TypeError, ValueError):
+                return None
+        else:
+            queryset = self.filter_queryset(queryset)
+        version = queryset.order_by().aggregate(
+            count=Count('pk'),
+            updated_at=Max('updated_at'),
+            **{
+                f'{lookup}_updated_at': Max(f'{lookup}__updated_at')
+                for lookup in self.version_lookups
+            }
+        )
+        count = version.pop('count')
+        if not count:
+            return None
+        dates = list(version.values())
+        return (
+            f'{self.basename}-{self.action}-{count}-' + '-'.join(
+                str(date.timestamp() if date else 0) for date in dates
+            ) + self.get_query_version(),
+            max(filter(None, dates))
+        )
+
+    def get_query_version(self):
+        """Хэш параметров запроса списка: фильтров и страницы."""
+        if self.action != 'list' or not self.request.query_params:
+            return ''
+        query = urlencode(
+            sorted(self.request.query_params.lists()), doseq=True
+        )
+        return '-' + hashlib.md5(query.encode()).hexdigest()
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        version = self.get_version()
+        if version is None:
+            return handler(request, *args, **kwargs)
+        etag, last_modified = version
+        etag = quote_etag(etag)
+        last_modified = int(last_modified.timestamp())
+        # Удаление объекта из списка не сдвигает дату изменения:
+        # If-Modified-Since без ETag, в котором есть число объектов,
+        # вернул бы 304 со старым списком. Удалённый объект при
+        # retrieve версии не имеет, и ответ - 404.
+        response = get_conditional_response(
+            request, etag=etag,
+            last_modified=None if self.action == 'list' else last_modified
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (status.HTTP_200_OK,
+                                    status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            if self.vary_on_user:
+                patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().retrieve, request, *args, **kwargs
+        )
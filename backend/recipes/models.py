@@ -1,6 +1,7 @@
 from colorfield.fields import ColorField
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import (MaxValueValidator, MinValueValidator,
                                     RegexValidator)
 from django.db import models
@@ -10,11 +11,19 @@ User = get_user_model()
 
 
 class NameBaseModel(models.Model):
-    """Абстрактная модель с полем name."""
+    """Абстрактная модель с полями name и updated_at.
+
+    updated_at служит версией объекта для условных GET-запросов.
+    """
     name = models.CharField(
         'Название',
         max_length=settings.LETTERS_IN_FIELD
     )
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True,
+        db_index=True
+    )
 
     class Meta:
         abstract = True
@@ -77,6 +86,12 @@ class Ingredient(NameBaseModel):
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
         ordering = ('name',)
+        constraints = [
+            UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient'
+            )
+        ]
 
     def __str__(self):
         return (f'{self.name[:settings.FIELDS_SHORT_NAME]}, '
@@ -130,6 +145,24 @@ class Recipe(NameBaseModel):
         'Картинка',
         upload_to='recipes/images/'
     )
+    image_webp = models.ImageField(
+        'Картинка в WebP',
+        upload_to='recipes/images/',
+        blank=True,
+        editable=False
+    )
+    thumbnail = models.ImageField(
+        'Миниатюра',
+        upload_to='recipes/images/',
+        blank=True,
+        editable=False
+    )
+    thumbnail_webp = models.ImageField(
+        'Миниатюра в WebP',
+        upload_to='recipes/images/',
+        blank=True,
+        editable=False
+    )
     tags = models.ManyToManyField(
         Tag,
         related_name='tags_recipe'
@@ -140,11 +173,31 @@ class Recipe(NameBaseModel):
         verbose_name='Список ингредиентов',
         related_name='recipes'
     )
+    search_vector = SearchVectorField(
+        'Поисковый вектор',
+        null=True,
+        editable=False
+    )
+    favorites_count = models.PositiveIntegerField(
+        'Добавлений в избранное',
+        default=0,
+        editable=False
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        'Добавлений в корзину',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-id',)
+        indexes = [
+            models.Index(
+                fields=['author', '-id'], name='recipe_author_id_idx'
+            )
+        ]
 
     def __str__(self):
         return self.name[:settings.FIELDS_SHORT_NAME]
@@ -182,6 +235,13 @@ class RecipeIngredient(models.Model):
         verbose_name = 'Ингридеент Рецепта'
         verbose_name_plural = 'Ингридеенты Рецепта'
         ordering = ('-id',)
+        indexes = [
+            models.Index(
+                fields=['recipes', 'ingredients'],
+                include=['amount'],
+                name='recipeingredient_recipe_idx'
+            )
+        ]
 
     def __str__(self):
         return (f'{self.ingredients.name[:settings.FIELDS_SHORT_NAME]}, '
@@ -246,3 +306,55 @@ class ShoppingCart(UserRecipeBaseModel):
     def __str__(self):
         return (f'{self.user.username[:settings.FIELDS_SHORT_NAME]} '
                 f'- {self.recipe.name[:settings.FIELDS_SHORT_NAME]}')
+
+
+class ShoppingListItem(UserBaseModel):
+    """Суммарное количество ингредиента в корзине пользователя.
+
+    Поддерживается при изменении корзины и состава рецептов в ней,
+    см. recipes.shopping_totals.
+    """
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items'
+    )
+    amount = models.IntegerField('Количество', default=0)
+
+    class Meta:
+        verbose_name = 'Строка списка покупок'
+        verbose_name_plural = 'Списки покупок'
+        ordering = ('user', 'ingredient')
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shoppinglistitem'
+            )
+        ]
+
+    def __str__(self):
+        return (f'{self.user.username[:settings.FIELDS_SHORT_NAME]} '
+                f'- {self.ingredient} - {self.amount}')
+
+
+class FeedEntry(UserRecipeBaseModel):
+    """Рецепт в ленте подписок пользователя.
+
+    Записи создаются рассылкой при публикации рецепта; рецепты
+    авторов с очень большим числом подписчиков в ленту не
+    рассылаются и подмешиваются при чтении, см. recipes.feed.
+    """
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        ordering = ('-recipe',)
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'recipe'], name='unique_feedentry'
+            )
+        ]
+
+    def __str__(self):
+        return (f'{self.user.username[:settings.FIELDS_SHORT_NAME]} '
+                f'- {self.recipe.name[:settings.FIELDS_SHORT_NAME]}')
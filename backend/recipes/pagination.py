@@ -1,5 +1,39 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 class LimitPagination(PageNumberPagination):
     page_size_query_param = 'limit'
+
+
+class LimitCursorPagination(CursorPagination):
+    """Keyset-пагинация по убыванию id с непрозрачным курсором."""
+    ordering = '-id'
+    page_size_query_param = 'limit'
+
+
+class LimitOrCursorPagination(LimitPagination):
+    """Постраничная пагинация с необязательным режимом курсора.
+
+    Параметр cursor (для первой страницы - пустой) включает
+    keyset-пагинацию без COUNT(*) и OFFSET, остальные запросы
+    обслуживаются как раньше по номеру страницы. Курсор задаёт
+    порядок по id, поэтому запрос со своей сортировкой (поиск
+    по релевантности) всегда разбивается по номеру страницы.
+    """
+    cursor_pagination_class = LimitCursorPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        cursor_query_param = self.cursor_pagination_class.cursor_query_param
+        if (cursor_query_param in request.query_params
+                and not queryset.query.order_by):
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
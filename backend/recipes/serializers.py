@@ -1,13 +1,18 @@
-import base64
-
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.files.base import ContentFile
+from django.core.cache import cache
 from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.urls import reverse
 from djoser.serializers import UserCreateSerializer, UserSerializer
+from recipes.cache import get_generation, recipe_cache_key
+from recipes.images import decode_base64_image, sanitize_image
 from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from recipes.shopping_totals import shift_totals
+from recipes.tasks import fan_out_recipe, render_recipe_images
 from rest_framework import serializers, status
 from rest_framework.exceptions import ValidationError
+from tasks.models import Task
 
 User = get_user_model()
 
@@ -93,18 +98,64 @@ class SpecialUserSerializer(UserSerializer):
 
 
 class Base64ImageField(serializers.ImageField):
+    """Картинка в base64 или файлом, сохраняется без метаданных."""
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
+            data = decode_base64_image(data)
+        if hasattr(data, 'read'):
+            data = sanitize_image(data)
+        return super().to_internal_value(data)
 
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
 
-        return super().to_internal_value(data)
+class BulkPrimaryKeyRelatedField(serializers.ManyRelatedField):
+    """Список первичных ключей, разрешаемый одним запросом id__in."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        child = self.child_relation
+        try:
+            pks = [int(pk) for pk in data]
+        except (TypeError, ValueError):
+            child.fail('incorrect_type', data_type=type(data).__name__)
+        objects = child.get_queryset().in_bulk(set(pks))
+        for pk in pks:
+            if pk not in objects:
+                child.fail('does_not_exist', pk_value=pk)
+        return [objects[pk] for pk in pks]
+
+
+# Все вложенные связи RecipeRSerializer: число запросов на страницу
+# рецептов не зависит от её размера.
+RECIPE_READ_PREFETCHES = (
+    'author',
+    'tags',
+    Prefetch(
+        'reciepes',
+        queryset=RecipeIngredient.objects.select_related('ingredients')
+    ),
+)
+
+
+class RecipeRListSerializer(serializers.ListSerializer):
+    """Список рецептов, собираемый из кэша представлений."""
+
+    def to_representation(self, data):
+        recipes = data.all() if hasattr(data, 'all') else data
+        return self.child.cached_representations(list(recipes))
 
 
 class RecipeRSerializer(serializers.ModelSerializer):
-    """Сериализатор рецепта только на чтение."""
+    """Сериализатор рецепта только на чтение.
+
+    Независимая от пользователя часть представления кэшируется
+    по id и updated_at рецепта и автора, флаги is_favorited,
+    is_in_shopping_cart и author.is_subscribed подставляются
+    при каждом ответе.
+    """
     tags = TagSerializer(many=True)
     author = SpecialUserSerializer(default=serializers.CurrentUserDefault())
     ingredients = RecipeIngredientRSerializer(many=True, source='reciepes')
@@ -124,17 +175,72 @@ class RecipeRSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_webp',
+            'thumbnail',
+            'thumbnail_webp',
             'text',
             'cooking_time'
         )
         read_only_fields = ('tags', 'author')
+        list_serializer_class = RecipeRListSerializer
+
+    def to_representation(self, instance):
+        return self.cached_representations([instance])[0]
+
+    def cached_representations(self, recipes):
+        request = self.context.get('request')
+        generation = get_generation()
+        # Автор нужен для ключа; загруженный через select_related
+        # повторно не запрашивается.
+        prefetch_related_objects(recipes, 'author')
+        keys = {
+            recipe.pk: recipe_cache_key(recipe, request, generation)
+            for recipe in recipes
+        }
+        cached = cache.get_many(list(keys.values()))
+        missing = [
+            recipe for recipe in recipes if keys[recipe.pk] not in cached
+        ]
+        if missing:
+            prefetch_related_objects(missing, *RECIPE_READ_PREFETCHES)
+            fresh = {
+                keys[recipe.pk]: self.shared_representation(recipe)
+                for recipe in missing
+            }
+            cache.set_many(fresh, settings.RECIPE_CACHE_TIMEOUT)
+            cached.update(fresh)
+        return [
+            self.add_user_flags(cached[keys[recipe.pk]], recipe)
+            for recipe in recipes
+        ]
+
+    def shared_representation(self, instance):
+        data = super().to_representation(instance)
+        data['is_favorited'] = False
+        data['is_in_shopping_cart'] = False
+        data['author']['is_subscribed'] = False
+        return data
+
+    def add_user_flags(self, data, instance):
+        if hasattr(instance, 'author_is_subscribed'):
+            is_subscribed = instance.author_is_subscribed
+        else:
+            is_subscribed = getattr(instance.author, 'is_subscribed', False)
+        data = dict(data)
+        data['is_favorited'] = getattr(instance, 'is_favorited', False)
+        data['is_in_shopping_cart'] = getattr(
+            instance, 'is_in_shopping_cart', False
+        )
+        data['author'] = dict(data['author'], is_subscribed=is_subscribed)
+        return data
 
 
 class RecipeCUDSerializer(serializers.ModelSerializer):
     """Сериализатор создания, редактирования и удаления рецепта."""
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True,
-        queryset=Tag.objects.all()
+    tags = BulkPrimaryKeyRelatedField(
+        child_relation=serializers.PrimaryKeyRelatedField(
+            queryset=Tag.objects.all()
+        )
     )
     author = SpecialUserSerializer(default=serializers.CurrentUserDefault())
     ingredients = RecipeIngredientSerializer(many=True)
@@ -151,8 +257,6 @@ class RecipeCUDSerializer(serializers.ModelSerializer):
             'tags',
             'author',
             'ingredients',
-            'is_favorited',
-            'is_in_shopping_cart',
             'name',
             'image',
             'text',
@@ -174,25 +278,34 @@ class RecipeCUDSerializer(serializers.ModelSerializer):
         return super().validate(attrs)
 
     def validate_ingredients(self, value):
+        """Проверяет ингредиенты одним запросом к базе.
+
+        Повторы и несуществующие id отсеиваются в памяти,
+        в каждый элемент добавляется найденный объект Ingredient.
+        """
         if not value:
             raise serializers.ValidationError(
                 'Пустое поле ingredients',
                 status.HTTP_400_BAD_REQUEST
             )
-        ingredients = set()
+        existing = Ingredient.objects.in_bulk(
+            {ingredient['id'] for ingredient in value}
+        )
+        seen = set()
         for ingredient in value:
-            if ingredient not in self.instance.recipes.all():
+            obj = existing.get(ingredient['id'])
+            if obj is None:
                 raise serializers.ValidationError(
-                    detail='Ингридент не существует',
+                    detail=f'Ингридент {ingredient["id"]} не существует',
                     code=status.HTTP_400_BAD_REQUEST
                 )
-            obj = Ingredient.objects.get(id=ingredient['id'])
-            if obj in ingredients:
+            if obj.id in seen:
                 raise serializers.ValidationError(
                     detail=f'Ингридент {obj} можно добавить только один раз',
                     code=status.HTTP_400_BAD_REQUEST
                 )
-            ingredients.add(obj)
+            seen.add(obj.id)
+            ingredient['ingredient'] = obj
         return value
 
     def validate_tags(self, value):
@@ -215,7 +328,7 @@ class RecipeCUDSerializer(serializers.ModelSerializer):
     def create_recipeingredient(self, ingredients, recipe):
         RecipeIngredient.objects.bulk_create(
             [RecipeIngredient(
-                ingredients=Ingredient.objects.get(id=ingredient['id']),
+                ingredients=ingredient['ingredient'],
                 recipes=recipe,
                 amount=ingredient['amount']) for ingredient in ingredients]
         )
@@ -227,23 +340,85 @@ class RecipeCUDSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
         self.create_recipeingredient(ingredients=ingredients, recipe=recipe)
+        self.schedule_renditions(recipe)
+        fan_out_recipe.delay(recipe_id=recipe.pk)
         recipe.is_favorited = False
         recipe.is_in_shopping_cart = False
         recipe.author.is_subscribed = False
         return recipe
 
+    def update_recipeingredient(self, ingredients, recipe):
+        """Приводит ингредиенты рецепта к новому списку по разнице.
+
+        Добавляются, обновляются и удаляются только изменившиеся
+        строки. Возвращает True, если что-то изменилось.
+        """
+        current = {
+            row.ingredients_id: row
+            for row in RecipeIngredient.objects.filter(recipes=recipe)
+        }
+        wanted = {
+            ingredient['ingredient'].id: ingredient
+            for ingredient in ingredients
+        }
+        removed = [
+            row.id for ingredient_id, row in current.items()
+            if ingredient_id not in wanted
+        ]
+        changed = []
+        for ingredient_id, row in current.items():
+            if (ingredient_id in wanted
+                    and row.amount != wanted[ingredient_id]['amount']):
+                row.amount = wanted[ingredient_id]['amount']
+                changed.append(row)
+        added = [
+            ingredient for ingredient_id, ingredient in wanted.items()
+            if ingredient_id not in current
+        ]
+        if not (removed or changed or added):
+            return False
+        # Списки покупок корзин с этим рецептом: старый состав
+        # вычитается, новый прибавляется.
+        shift_totals([recipe.id], -1)
+        if removed:
+            # У RecipeIngredient нет обработчиков сигналов удаления,
+            # поэтому это один DELETE, а не запрос на каждую строку.
+            RecipeIngredient.objects.filter(id__in=removed).delete()
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ('amount',))
+        if added:
+            self.create_recipeingredient(ingredients=added, recipe=recipe)
+        shift_totals([recipe.id], 1)
+        return True
+
     @transaction.atomic
     def update(self, instance, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
-        instance = super().update(instance, validated_data)
-        instance.tags.clear()
-        instance.tags.set(tags)
-        instance.ingredients.clear()
-        self.create_recipeingredient(recipe=instance, ingredients=ingredients)
-        instance.save()
+        fields = [
+            attr for attr, value in validated_data.items()
+            if getattr(instance, attr) != value
+        ]
+        tags_changed = (
+            {tag.id for tag in tags}
+            != set(instance.tags.values_list('id', flat=True))
+        )
+        if tags_changed:
+            instance.tags.set(tags)
+        ingredients_changed = self.update_recipeingredient(
+            recipe=instance, ingredients=ingredients
+        )
+        if fields or tags_changed or ingredients_changed:
+            for attr in fields:
+                setattr(instance, attr, validated_data[attr])
+            instance.save(update_fields=(*fields, 'updated_at'))
+        if 'image' in fields:
+            self.schedule_renditions(instance)
         return instance
 
+    def schedule_renditions(self, recipe):
+        render_recipe_images.delay(recipe_id=recipe.pk)
+
     def to_representation(self, instance):
         request = self.context.get('request')
         context = {'request': request}
@@ -260,10 +435,21 @@ class RecipeFavSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'thumbnail',
+            'thumbnail_webp',
             'cooking_time'
         )
 
 
+class RecipeBatchSerializer(serializers.Serializer):
+    """Список id рецептов для пакетного добавления или удаления."""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.MAX_BATCH_RECIPES
+    )
+
+
 class FollowSerialiser(SpecialUserSerializer):
     """Сериализатор подписок."""
     recipes_count = serializers.IntegerField(read_only=True)
@@ -286,10 +472,14 @@ class FollowSerialiser(SpecialUserSerializer):
         )
 
     def get_recipes(self, obj):
-        limit = self.context.get('recipes_limit')
-        recipes = obj.recipes_author.all()
-        if limit:
-            recipes = recipes[:int(limit)]
+        recipes_by_author = self.context.get('recipes_by_author')
+        if recipes_by_author is not None:
+            recipes = recipes_by_author.get(obj.id, [])
+        else:
+            limit = self.context.get('recipes_limit')
+            recipes = obj.recipes_author.all()
+            if limit:
+                recipes = recipes[:int(limit)]
         serializer = RecipeFavSerializer(recipes, many=True, read_only=True)
         return serializer.data
 
@@ -307,3 +497,22 @@ class FollowSerialiser(SpecialUserSerializer):
                 status.HTTP_400_BAD_REQUEST
             )
         return attrs
+
+
+class ExportSerializer(serializers.ModelSerializer):
+    """Сериализатор фоновой выгрузки списка покупок.
+
+    Вместо пути к файлу отдаётся ссылка на скачивание через API.
+    """
+    result = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Task
+        fields = ('id', 'status', 'result', 'created_at', 'finished_at')
+
+    def get_result(self, obj):
+        if obj.status != Task.DONE or not obj.result:
+            return None
+        url = reverse('exports-download', kwargs={'pk': obj.pk})
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
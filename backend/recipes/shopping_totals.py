@@ -0,0 +1,66 @@
+from django.db import connection
+
+from .models import RecipeIngredient, ShoppingCart, ShoppingListItem
+
+
+def table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def shift_totals(recipe_ids, sign, user_id=None):
+    """Добавляет (sign=1) или вычитает (sign=-1) состав рецептов.
+
+    Затрагивает корзины, где лежат рецепты recipe_ids, или только
+    корзину user_id. Одна вставка с ON CONFLICT DO UPDATE прибавляет
+    количества к строкам списка, обнулившиеся строки удаляются.
+    При вычитании вызывается до удаления строк корзины, при
+    добавлении - после их создания.
+    """
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    params = [sign, *recipe_ids]
+    user_filter = ''
+    if user_id is not None:
+        user_filter = 'AND cart.user_id = %s'
+        params.append(user_id)
+    items = table(ShoppingListItem)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {items} (user_id, ingredient_id, amount) '
+            'SELECT cart.user_id, ri.ingredients_id, SUM(ri.amount) * %s '
+            f'FROM {table(ShoppingCart)} AS cart '
+            f'JOIN {table(RecipeIngredient)} AS ri '
+            'ON ri.recipes_id = cart.recipe_id '
+            f'WHERE cart.recipe_id IN ({placeholders}) {user_filter} '
+            'GROUP BY cart.user_id, ri.ingredients_id '
+            'ON CONFLICT (user_id, ingredient_id) DO UPDATE '
+            f'SET amount = {items}.amount + EXCLUDED.amount',
+            params
+        )
+    if sign < 0:
+        stale = ShoppingListItem.objects.filter(amount__lte=0)
+        if user_id is not None:
+            stale = stale.filter(user_id=user_id)
+        else:
+            stale = stale.filter(
+                ingredient__ingredients__recipes__in=recipe_ids
+            )
+        stale.delete()
+
+
+def rebuild_totals():
+    """Пересчитывает списки покупок всех пользователей с нуля."""
+    ShoppingListItem.objects.all().delete()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table(ShoppingListItem)} '
+            '(user_id, ingredient_id, amount) '
+            'SELECT cart.user_id, ri.ingredients_id, SUM(ri.amount) '
+            f'FROM {table(ShoppingCart)} AS cart '
+            f'JOIN {table(RecipeIngredient)} AS ri '
+            'ON ri.recipes_id = cart.recipe_id '
+            'GROUP BY cart.user_id, ri.ingredients_id'
+        )
+        return cursor.rowcount
@@ -0,0 +1,121 @@
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from .cache import bump_generation
+from .counters import COUNTERS, change_counter
+from .feed import backfill, unfollow
+from .ingredient_index import ingredient_index
+from .models import Favorite, Follow, Ingredient, Recipe, ShoppingCart, Tag
+from .shopping_totals import shift_totals
+
+# Связи, которые можно поменять у существующей строки (например,
+# в списке админки). Значения запоминаются при загрузке объекта,
+# и при сохранении зависимые данные переносятся со старых на новые.
+TRACKED_FIELDS = {
+    Recipe: ('author_id',),
+    Follow: ('user_id', 'following_id'),
+    Favorite: ('recipe_id',),
+    ShoppingCart: ('user_id', 'recipe_id'),
+}
+
+
+def remember_links(sender, instance, **kwargs):
+    instance._saved_links = {
+        field: instance.__dict__[field]
+        for field in TRACKED_FIELDS[sender] if field in instance.__dict__
+    }
+
+
+def find_moved_links(sender, instance, **kwargs):
+    """Перед сохранением находит прежние значения изменённых связей.
+
+    В instance._moved_links - прежние значения всех отслеживаемых
+    полей или None, если строка новая или связи не меняются.
+    """
+    instance._moved_links = None
+    if instance._state.adding:
+        return
+    fields = TRACKED_FIELDS[sender]
+    saved = instance._saved_links
+    if not saved.keys() >= set(fields):
+        # Поле было отложено при загрузке: прежнее значение - из базы.
+        saved = sender.objects.filter(
+            pk=instance.pk
+        ).values(*fields).first() or {}
+    current = {field: getattr(instance, field) for field in fields}
+    if saved and saved != current:
+        instance._moved_links = saved
+    instance._saved_links = current
+
+
+for tracked_sender in TRACKED_FIELDS:
+    post_init.connect(remember_links, sender=tracked_sender)
+    pre_save.connect(find_moved_links, sender=tracked_sender)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_recipe_representations(sender, **kwargs):
+    bump_generation()
+
+
+@receiver(pre_save, sender=ShoppingCart)
+def remove_moved_from_shopping_list(sender, instance, **kwargs):
+    # Вычитается, пока строка корзины ещё связана с прежними значениями.
+    previous = instance._moved_links
+    if previous is not None:
+        shift_totals(
+            [previous['recipe_id']], -1, user_id=previous['user_id']
+        )
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(sender, instance, created, **kwargs):
+    if created or instance._moved_links is not None:
+        shift_totals([instance.recipe_id], 1, user_id=instance.user_id)
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    shift_totals([instance.recipe_id], -1, user_id=instance.user_id)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_feed(sender, instance, created, **kwargs):
+    previous = instance._moved_links
+    if previous is not None:
+        unfollow(previous['user_id'], previous['following_id'])
+    if created or previous is not None:
+        backfill(instance.user, instance.following)
+
+
+@receiver(post_delete, sender=Follow)
+def clear_feed(sender, instance, **kwargs):
+    unfollow(instance.user_id, instance.following_id)
+
+
+def increment_counter(sender, instance, created, **kwargs):
+    _, field, _ = COUNTERS[sender]
+    if created:
+        change_counter(sender, [getattr(instance, field)], 1)
+    elif instance._moved_links is not None:
+        previous = instance._moved_links[field]
+        if previous != getattr(instance, field):
+            change_counter(sender, [previous], -1)
+            change_counter(sender, [getattr(instance, field)], 1)
+
+
+def decrement_counter(sender, instance, **kwargs):
+    _, field, _ = COUNTERS[sender]
+    change_counter(sender, [getattr(instance, field)], -1)
+
+
+for counter_sender in COUNTERS:
+    post_save.connect(increment_counter, sender=counter_sender)
+    post_delete.connect(decrement_counter, sender=counter_sender)
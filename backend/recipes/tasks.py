@@ -0,0 +1,34 @@
+import tempfile
+
+from django.core.files import File
+from tasks.models import Task
+from tasks.queue import task
+
+from .exporters import EXPORTERS, shopping_list
+from .feed import fan_out
+from .images import make_renditions
+from .models import Recipe
+
+
+@task
+def render_recipe_images(job, recipe_id):
+    make_renditions(recipe_id)
+
+
+@task
+def export_shopping_list(job, export_format):
+    exporter = EXPORTERS[export_format](shopping_list(job.user).iterator())
+    with tempfile.TemporaryFile() as file:
+        exporter.render(file)
+        file.seek(0)
+        job.result.save(exporter.filename, File(file), save=False)
+    Task.objects.filter(pk=job.pk).update(result=job.result.name)
+
+
+@task
+def fan_out_recipe(job, recipe_id):
+    recipe = Recipe.objects.select_related('author').filter(
+        pk=recipe_id
+    ).first()
+    if recipe is not None:
+        fan_out(recipe)
@@ -0,0 +1,1030 @@
+import base64
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock, skipIf, skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image, features
+from rest_framework.test import APITestCase
+from tasks.models import Task
+
+from .feed import fan_out, rebuild_feeds
+from .images import make_renditions, sanitize_image
+from .ingredient_index import ingredient_index
+from .management.commands.explain_queries import Command as ExplainCommand
+from .models import (Favorite, FeedEntry, Follow, Ingredient, Recipe,
+                     RecipeIngredient, ShoppingCart, ShoppingListItem, Tag)
+
+User = get_user_model()
+
+
+class RecipeFixturesMixin:
+    """Пользователь, теги, ингредиенты и рецепты для тестов API."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com',
+            first_name='Автор', last_name='Авторов', password='pass'
+        )
+        # bulk_create не возвращает id на SQLite, объекты перечитываются.
+        Tag.objects.bulk_create([
+            Tag(name=f'Тег {number}', color='#E26C2D', slug=f'tag{number}')
+            for number in range(3)
+        ])
+        Ingredient.objects.bulk_create([
+            Ingredient(name=f'Ингредиент {number:02}', measurement_unit='г')
+            for number in range(40)
+        ])
+        cls.tags = list(Tag.objects.all())
+        cls.ingredients = list(Ingredient.objects.all())
+
+    @classmethod
+    def create_recipes(cls, count, ingredients=3):
+        Recipe.objects.bulk_create([
+            Recipe(
+                author=cls.author, name=f'Рецепт {number}', text='Текст',
+                cooking_time=10, image='recipes/images/recipe.png'
+            )
+            for number in range(count)
+        ])
+        recipes = list(Recipe.objects.order_by('-id')[:count])
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipes=recipe, ingredients=ingredient, amount=5)
+            for recipe in recipes
+            for ingredient in cls.ingredients[:ingredients]
+        ])
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for recipe in recipes
+            for tag in cls.tags
+        ])
+        return recipes
+
+    def use_temporary_media(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        media = override_settings(MEDIA_ROOT=directory)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def recipe_data(self, ingredients):
+        image = io.BytesIO()
+        Image.new('RGB', (8, 8), 'red').save(image, 'PNG')
+        return {
+            'tags': [tag.id for tag in self.tags],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 10}
+                for ingredient in self.ingredients[:ingredients]
+            ],
+            'name': f'Рецепт из {ingredients} ингредиентов',
+            'image': 'data:image/png;base64,' + base64.b64encode(
+                image.getvalue()
+            ).decode(),
+            'text': 'Текст',
+            'cooking_time': 15,
+        }
+
+    def count_queries(self, method, *args, **kwargs):
+        with CaptureQueriesContext(connection) as context:
+            response = method(*args, **kwargs)
+        self.assertLess(response.status_code, 300, response.data)
+        return len(context.captured_queries)
+
+
+class RecipeListQueriesTest(RecipeFixturesMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.create_recipes(60)
+
+    def list_queries(self, limit):
+        cache.clear()
+        return self.count_queries(
+            self.client.get, '/api/recipes/', {'limit': limit}
+        )
+
+    def test_list_queries_do_not_depend_on_page_size(self):
+        self.assertEqual(self.list_queries(6), self.list_queries(50))
+
+    def test_list_queries_do_not_depend_on_page_size_for_user(self):
+        self.client.force_authenticate(self.author)
+        self.assertEqual(self.list_queries(6), self.list_queries(50))
+
+    def test_cached_page_reflects_author_change(self):
+        self.list_queries(6)
+        self.author.first_name = 'Переименованный'
+        self.author.save()
+        response = self.client.get('/api/recipes/', {'limit': 6})
+        self.assertEqual(
+            {recipe['author']['first_name']
+             for recipe in response.data['results']},
+            {'Переименованный'}
+        )
+
+
+class CursorPaginationTest(RecipeFixturesMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.recipes = cls.create_recipes(7)
+
+    def test_cursor_walks_all_recipes_newest_first(self):
+        url, ids = '/api/recipes/?cursor=&limit=3', []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            ids += [recipe['id'] for recipe in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(ids, [recipe.id for recipe in self.recipes])
+
+    def test_search_keeps_relevance_order_with_cursor(self):
+        first, second = self.recipes[-2:]
+        Recipe.objects.filter(pk=first.pk).update(text='Очень вкусный')
+        Recipe.objects.filter(pk=second.pk).update(name='Самый вкусный')
+        response = self.client.get(
+            '/api/recipes/', {'cursor': '', 'search': 'вкусный'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [second.id, first.id]
+        )
+
+
+class SubscriptionsTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            first_name='Читатель', last_name='Читателев', password='pass'
+        )
+        User.objects.bulk_create([
+            User(
+                username=f'author{number}',
+                email=f'author{number}@example.com',
+                first_name='Автор', last_name=str(number)
+            )
+            for number in range(12)
+        ])
+        cls.authors = list(User.objects.filter(username__startswith='author'))
+        Recipe.objects.bulk_create([
+            Recipe(
+                author=author, name=f'Рецепт {number}', text='Текст',
+                cooking_time=10, image='recipes/images/recipe.png'
+            )
+            for author in cls.authors
+            for number in range(4)
+        ])
+        Follow.objects.bulk_create([
+            Follow(user=cls.reader, following=author)
+            for author in cls.authors
+        ])
+
+    def setUp(self):
+        self.client.force_authenticate(self.reader)
+
+    def subscriptions(self, **params):
+        response = self.client.get('/api/users/subscriptions/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_recipes_limit_keeps_latest_recipes_of_each_author(self):
+        results = self.subscriptions(limit=12, recipes_limit=2)
+        self.assertEqual(len(results), 12)
+        for author in results:
+            latest = list(Recipe.objects.filter(
+                author_id=author['id']
+            ).order_by('-id').values_list('id', flat=True)[:2])
+            with self.subTest(author=author['username']):
+                self.assertEqual(
+                    [recipe['id'] for recipe in author['recipes']], latest
+                )
+
+    def test_invalid_recipes_limit_returns_all_recipes(self):
+        for value in ('0', '-1', 'abc'):
+            with self.subTest(recipes_limit=value):
+                results = self.subscriptions(limit=1, recipes_limit=value)
+                self.assertEqual(len(results[0]['recipes']), 4)
+
+    def test_queries_do_not_depend_on_page_size(self):
+        with CaptureQueriesContext(connection) as context:
+            self.subscriptions(limit=2, recipes_limit=3)
+        with self.assertNumQueries(len(context.captured_queries)):
+            self.assertEqual(
+                len(self.subscriptions(limit=12, recipes_limit=3)), 12
+            )
+
+
+class ConditionalGetTest(RecipeFixturesMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.recipes = cls.create_recipes(3)
+
+    def setUp(self):
+        # bulk_create в фикстурах не отправляет сигналы сброса индекса.
+        ingredient_index.invalidate()
+
+    def test_ingredient_search_etag_comes_from_index(self):
+        url = '/api/ingredients/'
+        etag = self.client.get(url, {'name': 'ингредиент 1'})['ETag']
+        self.assertNotEqual(
+            etag, self.client.get(url, {'name': 'ингредиент 2'})['ETag']
+        )
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                url, {'name': 'ингредиент 1'}, HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEqual(response.status_code, 304)
+
+    def test_recipe_list_etag_depends_on_query(self):
+        url = '/api/recipes/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        for params in ({'limit': 1}, {'page': 2, 'limit': 1},
+                       {'tags': self.tags[0].slug}):
+            with self.subTest(params=params):
+                self.assertNotEqual(
+                    self.client.get(url, params)['ETag'], etag
+                )
+
+    def test_recipe_list_etag_depends_on_user_flags(self):
+        url = '/api/recipes/'
+        self.client.force_authenticate(self.author)
+        etag = self.client.get(url)['ETag']
+        self.client.post(f'/api/recipes/{self.recipes[0].id}/favorite/')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['results'][0]['is_favorited'])
+
+    def test_etags_depend_on_related_objects(self):
+        urls = ('/api/recipes/', f'/api/recipes/{self.recipes[0].id}/')
+        changes = {
+            'tag': self.tags[0].save,
+            'ingredient': self.ingredients[0].save,
+            'author': self.author.save,
+        }
+        for name, change in changes.items():
+            etags = [self.client.get(url)['ETag'] for url in urls]
+            change()
+            for url, etag in zip(urls, etags):
+                with self.subTest(change=name, url=url):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                    self.assertEqual(response.status_code, 200)
+
+    def test_if_modified_since_alone_does_not_hide_deletion(self):
+        url = '/api/recipes/'
+        last_modified = self.client.get(url)['Last-Modified']
+        Recipe.objects.filter(id=self.recipes[-1].id).delete()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+
+
+class IngredientSearchTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create([
+            Ingredient(name=name, measurement_unit='г')
+            for name in ('Мазюзь', 'зюзник', 'Большой зюзник', 'Зюзька',
+                         'Зюзник')
+        ])
+
+    def setUp(self):
+        ingredient_index.invalidate()
+
+    def search(self, name):
+        response = self.client.get('/api/ingredients/', {'name': name})
+        self.assertEqual(response.status_code, 200)
+        return [ingredient['name'] for ingredient in response.data]
+
+    def test_prefix_matches_come_first(self):
+        self.assertEqual(
+            self.search('ЗЮЗ'),
+            ['зюзник', 'Зюзник', 'Зюзька', 'Большой зюзник', 'Мазюзь']
+        )
+
+    def test_substring_matches_follow_in_name_order(self):
+        self.assertEqual(
+            self.search('юзн'), ['Большой зюзник', 'зюзник', 'Зюзник']
+        )
+
+    def test_index_sees_new_ingredients(self):
+        self.search('зюз')
+        Ingredient.objects.create(name='Зюзя', measurement_unit='г')
+        self.assertEqual(self.search('зюзя'), ['Зюзя'])
+
+
+class RecipeSearchTest(RecipeFixturesMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for name, text in (
+            ('Украинский борщ', 'Свёкла, капуста и пампушки.'),
+            ('Винегрет', 'Почти как борщ, только холодный.'),
+            ('Омлет', 'Яйца и молоко.'),
+        ):
+            Recipe.objects.create(
+                author=cls.author, name=name, text=text, cooking_time=10,
+                image='recipes/images/recipe.png'
+            )
+
+    def search(self, value):
+        response = self.client.get('/api/recipes/', {'search': value})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['name'] for recipe in response.data['results']]
+
+    def test_name_matches_rank_above_text_matches(self):
+        self.assertEqual(
+            self.search('борщ'), ['Украинский борщ', 'Винегрет']
+        )
+
+    def test_blank_search_is_ignored(self):
+        self.assertEqual(len(self.search('  ')), 3)
+
+    # LIKE в SQLite не различает регистр только у латиницы.
+    @skipIf(connection.vendor == 'postgresql', 'Поиск по вхождению')
+    def test_fallback_matches_substrings(self):
+        self.assertEqual(self.search('пампуш'), ['Украинский борщ'])
+        self.assertEqual(self.search('олодн'), ['Винегрет'])
+
+    @skipUnless(connection.vendor == 'postgresql', 'Полнотекстовый поиск')
+    def test_full_text_search_matches_word_forms(self):
+        self.assertEqual(
+            self.search('Борща'), ['Украинский борщ', 'Винегрет']
+        )
+        self.assertEqual(self.search('яйцо'), ['Омлет'])
+
+
+class LoadIngredientsTest(TestCase):
+    ROWS = [('Зюзник', 'г'), ('Зюзник', 'шт.'), ('Мазюзь', 'мл')]
+
+    def write(self, name, content):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def load(self, path):
+        before = Ingredient.objects.count()
+        call_command('load_ingredients', path, stdout=io.StringIO())
+        return Ingredient.objects.count() - before
+
+    def test_csv_reload_adds_nothing(self):
+        path = self.write('ingredients.csv', ''.join(
+            f'{name},{unit}\n' for name, unit in self.ROWS + self.ROWS[:1]
+        ))
+        self.assertEqual(self.load(path), 3)
+        self.assertEqual(self.load(path), 0)
+        self.assertEqual(
+            set(Ingredient.objects.filter(
+                name__in=['Зюзник', 'Мазюзь']
+            ).values_list('name', 'measurement_unit')),
+            set(self.ROWS)
+        )
+
+    def test_json_after_csv_adds_only_new_rows(self):
+        self.load(self.write('ingredients.csv', 'Зюзник,г\n'))
+        path = self.write('ingredients.json', json.dumps([
+            {'name': name, 'measurement_unit': unit}
+            for name, unit in self.ROWS
+        ]))
+        self.assertEqual(self.load(path), 2)
+
+    def test_unsupported_file_is_rejected(self):
+        with self.assertRaises(CommandError):
+            self.load(self.write('ingredients.txt', 'Зюзник,г\n'))
+
+
+class RecipeImportExportTest(RecipeFixturesMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.create_recipes(3)
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'recipes.ndjson')
+
+    def export(self):
+        call_command('export_recipes', self.path, stderr=io.StringIO())
+        with open(self.path, encoding='utf-8') as file:
+            rows = [json.loads(line) for line in file]
+        for row in rows:
+            row['tags'].sort()
+        return rows
+
+    def load(self, content=None):
+        if content is not None:
+            with open(self.path, 'w', encoding='utf-8') as file:
+                file.write(content)
+        call_command(
+            'import_recipes', self.path, batch_size=2, stdout=io.StringIO()
+        )
+
+    def test_round_trip(self):
+        exported = self.export()
+        self.assertEqual(len(exported), 3)
+        Recipe.objects.all().delete()
+        self.load()
+        self.assertEqual(self.export(), exported)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 3)
+
+    def test_unknown_author_is_rejected(self):
+        row, *_ = self.export()
+        row['author'] = 'nobody@example.com'
+        with self.assertRaisesMessage(CommandError, 'nobody@example.com'):
+            self.load(json.dumps(row) + '\n')
+
+    def test_broken_line_is_reported(self):
+        with self.assertRaisesMessage(CommandError, 'Строка 2'):
+            self.load('\n{\n')
+
+
+class RecipeDeleteQueriesTest(RecipeFixturesMixin, APITestCase):
+
+    def delete_queries(self, ingredients):
+        recipe, = self.create_recipes(1, ingredients)
+        self.client.force_authenticate(self.author)
+        return self.count_queries(
+            self.client.delete, f'/api/recipes/{recipe.id}/'
+        )
+
+    def test_delete_queries_do_not_depend_on_ingredients(self):
+        self.assertEqual(self.delete_queries(3), self.delete_queries(30))
+
+
+@override_settings(TASKS_BACKEND='eager')
+class ExportDownloadTest(RecipeFixturesMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = User.objects.create_user(
+            username='other', email='other@example.com',
+            first_name='Другой', last_name='Пользователь', password='pass'
+        )
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        storage = Task._meta.get_field('result').storage
+        patcher = mock.patch.object(storage, 'location', directory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def export(self):
+        self.client.force_authenticate(self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(
+                '/api/recipes/download_shopping_cart/',
+                {'format': 'csv', 'async': 1}
+            )
+        self.assertEqual(response.status_code, 202)
+        return Task.objects.get(pk=response.data['id'])
+
+    def test_export_is_private_and_uniquely_named(self):
+        first, second = self.export(), self.export()
+        self.assertEqual(first.status, Task.DONE)
+        self.assertNotEqual(first.result.name, second.result.name)
+        self.assertFalse(first.result.path.startswith(settings.MEDIA_ROOT))
+
+    def test_only_owner_downloads_export(self):
+        export = self.export()
+        url = f'/api/exports/{export.id}/download/'
+        response = self.client.get(f'/api/exports/{export.id}/')
+        self.assertTrue(response.data['result'].endswith(url))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('attachment', response['Content-Disposition'])
+        self.assertTrue(b''.join(response.streaming_content))
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+
+class ShoppingListDownloadTest(RecipeFixturesMixin, APITestCase):
+    URL = '/api/recipes/download_shopping_cart/'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for recipe in cls.create_recipes(2):
+            ShoppingCart.objects.create(user=cls.author, recipe=recipe)
+
+    def setUp(self):
+        self.client.force_authenticate(self.author)
+        self.items = sorted(
+            (ingredient.name, ingredient.measurement_unit)
+            for ingredient in self.ingredients[:3]
+        )
+
+    def download(self, export_format):
+        response = self.client.get(self.URL, {'format': export_format})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            f'cart.{export_format}', response['Content-Disposition']
+        )
+        return b''.join(response.streaming_content)
+
+    def test_anonymous_user_is_rejected(self):
+        self.client.force_authenticate(None)
+        for params in ({'format': 'txt'}, {'format': 'csv', 'async': 1}):
+            with self.subTest(params=params):
+                response = self.client.get(self.URL, params)
+                self.assertEqual(response.status_code, 401)
+        self.assertFalse(Task.objects.exists())
+
+    def test_txt(self):
+        self.assertEqual(
+            self.download('txt').decode().splitlines(),
+            [f'{name} ({unit}) — 10' for name, unit in self.items]
+        )
+
+    def test_csv(self):
+        rows = list(csv.reader(io.StringIO(self.download('csv').decode())))
+        self.assertEqual(rows[0], ['name', 'measurement_unit', 'amount'])
+        self.assertEqual(
+            rows[1:],
+            [[name, unit, '10'] for name, unit in self.items]
+        )
+
+    def test_json(self):
+        self.assertEqual(
+            json.loads(self.download('json')),
+            [
+                {'name': name, 'measurement_unit': unit, 'amount': 10}
+                for name, unit in self.items
+            ]
+        )
+
+    def test_pdf(self):
+        self.assertTrue(self.download('pdf').startswith(b'%PDF'))
+
+    def test_unknown_format(self):
+        response = self.client.get(self.URL, {'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+
+class RecipeWriteQueriesTest(RecipeFixturesMixin, APITestCase):
+
+    def setUp(self):
+        self.use_temporary_media()
+        self.client.force_authenticate(self.author)
+
+    def create_queries(self, ingredients):
+        return self.count_queries(
+            self.client.post, '/api/recipes/',
+            self.recipe_data(ingredients), format='json'
+        )
+
+    def test_create_returns_recipe(self):
+        response = self.client.post(
+            '/api/recipes/', self.recipe_data(3), format='json'
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(len(response.data['ingredients']), 3)
+        self.assertFalse(response.data['is_favorited'])
+
+    def test_create_queries_do_not_depend_on_ingredients(self):
+        self.assertEqual(self.create_queries(3), self.create_queries(30))
+
+    def update_queries(self, ingredients):
+        recipe, = self.create_recipes(1, ingredients)
+        data = self.recipe_data(0)
+        # Половина ингредиентов удаляется, остальные меняют
+        # количество, столько же добавляется новых.
+        data['ingredients'] = [
+            {'id': ingredient.id, 'amount': 20}
+            for ingredient in self.ingredients[
+                ingredients // 2:ingredients + ingredients // 2
+            ]
+        ]
+        del data['image']
+        return self.count_queries(
+            self.client.patch, f'/api/recipes/{recipe.id}/', data,
+            format='json'
+        )
+
+    def test_update_queries_do_not_depend_on_ingredients(self):
+        self.assertEqual(self.update_queries(4), self.update_queries(30))
+
+
+class RecipeBatchTest(RecipeFixturesMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.recipes = cls.create_recipes(3)
+
+    def setUp(self):
+        self.client.force_authenticate(self.author)
+
+    def batch(self, method, ids):
+        response = getattr(self.client, method)(
+            '/api/recipes/shopping_cart/batch/', {'recipes': ids},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        return {row['id']: row['status'] for row in response.data['recipes']}
+
+    def test_batch_add_and_remove(self):
+        first, second, _ = self.recipes
+        ShoppingCart.objects.create(user=self.author, recipe=first)
+        missing = max(recipe.id for recipe in self.recipes) + 1
+        self.assertEqual(
+            self.batch('post', [first.id, second.id, missing]),
+            {first.id: 'exists', second.id: 'added', missing: 'not_found'}
+        )
+        second.refresh_from_db()
+        self.assertEqual(second.shopping_cart_count, 1)
+        self.assertEqual(
+            ShoppingListItem.objects.get(
+                user=self.author, ingredient=self.ingredients[0]
+            ).amount,
+            10
+        )
+        self.assertEqual(
+            self.batch('delete', [first.id, second.id, missing]),
+            {first.id: 'removed', second.id: 'removed', missing: 'not_found'}
+        )
+        second.refresh_from_db()
+        self.assertEqual(second.shopping_cart_count, 0)
+        self.assertFalse(ShoppingCart.objects.filter(user=self.author))
+        self.assertFalse(ShoppingListItem.objects.filter(user=self.author))
+
+
+class ReassignmentTest(RecipeFixturesMixin, TestCase):
+    """Смена связи у существующей строки, как в списке админки."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.reader = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            first_name='Читатель', last_name='Читателев', password='pass'
+        )
+        cls.first, cls.second = cls.create_recipes(2)
+        call_command('recount', stdout=io.StringIO())
+
+    def assertCounter(self, obj, field, expected):
+        obj.refresh_from_db()
+        self.assertEqual(getattr(obj, field), expected)
+
+    def test_favorite_recipe_change_moves_counter(self):
+        Favorite.objects.create(user=self.reader, recipe=self.first)
+        favorite = Favorite.objects.get()
+        favorite.recipe = self.second
+        favorite.save()
+        self.assertCounter(self.first, 'favorites_count', 0)
+        self.assertCounter(self.second, 'favorites_count', 1)
+
+    def test_recipe_author_change_moves_counter(self):
+        recipe = Recipe.objects.get(id=self.first.id)
+        recipe.author = self.reader
+        recipe.save()
+        self.assertCounter(self.author, 'recipes_count', 1)
+        self.assertCounter(self.reader, 'recipes_count', 1)
+
+    def test_follow_author_change_moves_counter(self):
+        Follow.objects.create(user=self.author, following=self.reader)
+        follow = Follow.objects.get()
+        follow.following = self.author
+        follow.user = self.reader
+        follow.save()
+        self.assertCounter(self.reader, 'followers_count', 0)
+        self.assertCounter(self.author, 'followers_count', 1)
+
+    def shopping_list(self, user):
+        return dict(ShoppingListItem.objects.filter(
+            user=user
+        ).values_list('ingredient_id', 'amount'))
+
+    def test_shopping_cart_change_moves_totals(self):
+        RecipeIngredient.objects.filter(recipes=self.second).update(amount=7)
+        ShoppingCart.objects.create(user=self.reader, recipe=self.first)
+        cart = ShoppingCart.objects.get()
+        cart.user = self.author
+        cart.recipe = self.second
+        cart.save()
+        self.assertEqual(self.shopping_list(self.reader), {})
+        self.assertEqual(
+            self.shopping_list(self.author),
+            {ingredient.id: 7 for ingredient in self.ingredients[:3]}
+        )
+        self.assertCounter(self.first, 'shopping_cart_count', 0)
+        self.assertCounter(self.second, 'shopping_cart_count', 1)
+
+    def test_follow_change_moves_feed(self):
+        other = User.objects.create_user(
+            username='other', email='other@example.com',
+            first_name='Другой', last_name='Пользователь', password='pass'
+        )
+        Follow.objects.create(user=self.reader, following=self.author)
+        follow = Follow.objects.get()
+        follow.user = other
+        follow.save()
+        self.assertFalse(FeedEntry.objects.filter(user=self.reader))
+        self.assertEqual(
+            set(FeedEntry.objects.filter(
+                user=other
+            ).values_list('recipe_id', flat=True)),
+            {self.first.id, self.second.id}
+        )
+
+    def test_save_without_changes_keeps_counter(self):
+        Favorite.objects.create(user=self.reader, recipe=self.first)
+        Favorite.objects.get().save()
+        self.assertCounter(self.first, 'favorites_count', 1)
+
+
+@override_settings(TASKS_BACKEND='eager')
+class FeedTest(RecipeFixturesMixin, APITestCase):
+    URL = '/api/recipes/feed/'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.reader = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            first_name='Читатель', last_name='Читателев', password='pass'
+        )
+        cls.recipes = cls.create_recipes(3)
+
+    def setUp(self):
+        self.use_temporary_media()
+
+    def follow(self):
+        return Follow.objects.create(user=self.reader, following=self.author)
+
+    def feed_ids(self):
+        self.client.force_authenticate(self.reader)
+        response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def feed_entries(self):
+        return set(FeedEntry.objects.filter(
+            user=self.reader
+        ).values_list('recipe_id', flat=True))
+
+    def test_feed_requires_authentication(self):
+        self.assertEqual(self.client.get(self.URL).status_code, 401)
+
+    def test_follow_backfills_feed_newest_first(self):
+        self.follow()
+        self.assertEqual(
+            self.feed_ids(), [recipe.id for recipe in self.recipes]
+        )
+
+    def test_new_recipe_is_fanned_out_to_followers(self):
+        self.follow()
+        self.client.force_authenticate(self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/recipes/', self.recipe_data(3), format='json'
+            )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertIn(response.data['id'], self.feed_entries())
+        self.assertEqual(self.feed_ids()[0], response.data['id'])
+
+    def test_unfollow_clears_feed(self):
+        self.follow().delete()
+        self.assertFalse(self.feed_entries())
+        self.assertEqual(self.feed_ids(), [])
+
+    @override_settings(FEED_PULL_THRESHOLD=1)
+    def test_popular_author_is_pulled_not_fanned_out(self):
+        User.objects.filter(id=self.author.id).update(followers_count=2)
+        self.author.refresh_from_db()
+        self.follow()
+        self.assertFalse(self.feed_entries())
+        self.assertEqual(
+            self.feed_ids(), [recipe.id for recipe in self.recipes]
+        )
+        fan_out(Recipe.objects.select_related('author').get(
+            id=self.recipes[0].id
+        ))
+        self.assertFalse(self.feed_entries())
+
+
+def image_bytes(image_format='PNG', size=(8, 4), **kwargs):
+    output = io.BytesIO()
+    Image.new('RGB', size, 'red').save(output, image_format, **kwargs)
+    return output.getvalue()
+
+
+class SanitizeImageTest(TestCase):
+
+    def assertRejected(self, data, message):
+        with self.assertRaisesMessage(ValidationError, message):
+            sanitize_image(ContentFile(data))
+
+    @override_settings(MAX_IMAGE_SIZE=10)
+    def test_rejects_large_file(self):
+        self.assertRejected(image_bytes(), 'Размер картинки')
+
+    def test_rejects_unsupported_format(self):
+        self.assertRejected(image_bytes('GIF'), 'Допустимые форматы')
+
+    @override_settings(MAX_IMAGE_PIXELS=31)
+    def test_rejects_large_resolution(self):
+        self.assertRejected(image_bytes(), 'Слишком большое разрешение')
+
+    def test_rejects_broken_file(self):
+        self.assertRejected(b'not an image', 'Не удалось прочитать')
+
+    def test_applies_orientation_and_strips_metadata(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x010F] = 'Camera'
+        result = sanitize_image(
+            ContentFile(image_bytes('JPEG', exif=exif.tobytes()))
+        )
+        self.assertTrue(result.name.endswith('.jpg'))
+        with Image.open(result) as image:
+            self.assertEqual(image.size, (4, 8))
+            self.assertFalse(image.getexif())
+
+
+class RenditionsTest(RecipeFixturesMixin, TestCase):
+    FIELDS = ('image_webp', 'thumbnail', 'thumbnail_webp')
+
+    def setUp(self):
+        self.use_temporary_media()
+        self.recipe = self.create_recipes(1)[0]
+        self.recipe.image.save('photo.png', ContentFile(image_bytes()))
+
+    def renditions(self):
+        make_renditions(self.recipe.id)
+        self.recipe.refresh_from_db()
+        return {field: getattr(self.recipe, field) for field in self.FIELDS}
+
+    def test_renditions_are_created(self):
+        renditions = self.renditions()
+        self.assertTrue(renditions['thumbnail'].name.endswith('_thumb.jpg'))
+        self.assertTrue(renditions['thumbnail'].storage.exists(
+            renditions['thumbnail'].name
+        ))
+        webp = features.check('webp')
+        self.assertEqual(bool(renditions['image_webp']), webp)
+        self.assertEqual(bool(renditions['thumbnail_webp']), webp)
+
+    def test_renditions_are_saved_independently(self):
+        with mock.patch('recipes.images.features.check', return_value=False):
+            renditions = self.renditions()
+        self.assertFalse(renditions['image_webp'])
+        self.assertFalse(renditions['thumbnail_webp'])
+        self.assertTrue(renditions['thumbnail'])
+        with mock.patch('recipes.images.Image.Image.save',
+                        side_effect=OSError), self.assertLogs(
+                            'recipes.images', 'ERROR'):
+            self.assertFalse(self.renditions()['thumbnail'])
+
+    def test_previous_renditions_are_deleted(self):
+        old = {
+            field: file.name for field, file in self.renditions().items()
+            if file
+        }
+        self.recipe.image.save('other.png', ContentFile(image_bytes()))
+        new = self.renditions()
+        for field, name in old.items():
+            with self.subTest(field=field):
+                self.assertNotEqual(new[field].name, name)
+                self.assertFalse(new[field].storage.exists(name))
+
+
+class BenchmarkCommandTest(RecipeFixturesMixin, TestCase):
+
+    def setUp(self):
+        self.use_temporary_media()
+
+    @override_settings(ALLOWED_HOSTS=[''])
+    def test_in_process_benchmark_saves_successful_baseline(self):
+        call_command(
+            'seed_data', users=3, recipes=10, follows=1, favorites=2,
+            cart=2, stdout=io.StringIO()
+        )
+        baseline = os.path.join(settings.MEDIA_ROOT, 'baseline.json')
+        call_command(
+            'benchmark', requests=30, warmup=5, baseline=baseline,
+            save_baseline=True, stdout=io.StringIO()
+        )
+        with open(baseline, encoding='utf-8') as file:
+            self.assertEqual(json.load(file)['total']['count'], 30)
+
+    def test_error_response_aborts_benchmark(self):
+        call_command('seed_data', users=2, recipes=2, stdout=io.StringIO())
+        with mock.patch(
+            'recipes.management.commands.benchmark.MIX', {'recipe_detail': 1}
+        ), mock.patch(
+            'recipes.management.commands.benchmark.Command.recipe_detail',
+            return_value=('get', '/api/recipes/0/')
+        ):
+            with self.assertRaisesMessage(CommandError, 'ответ 404'):
+                call_command('benchmark', requests=1, warmup=0,
+                             stdout=io.StringIO())
+
+
+class FeedRebuildTest(RecipeFixturesMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.reader = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            first_name='Читатель', last_name='Читателев', password='pass'
+        )
+        cls.recipes = cls.create_recipes(3)
+        # Подписка в обход сигналов, как у seed_data: ленты пусты.
+        Follow.objects.bulk_create([
+            Follow(user=cls.reader, following=cls.author)
+        ])
+        User.objects.filter(id=cls.author.id).update(followers_count=1)
+
+    @override_settings(FEED_BACKFILL=2)
+    def test_rebuild_adds_latest_recipes_of_followed_authors(self):
+        self.assertEqual(rebuild_feeds(), 2)
+        self.assertEqual(
+            set(FeedEntry.objects.filter(
+                user=self.reader
+            ).values_list('recipe_id', flat=True)),
+            {recipe.id for recipe in self.recipes[:2]}
+        )
+
+    @override_settings(FEED_PULL_THRESHOLD=0)
+    def test_rebuild_skips_pulled_authors(self):
+        self.assertEqual(rebuild_feeds(), 0)
+        self.assertFalse(FeedEntry.objects.exists())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'EXPLAIN только на PostgreSQL')
+class QueryPlanTest(RecipeFixturesMixin, TestCase):
+    # Индексы, один из которых должен быть в плане запроса.
+    INDEXES = {
+        'recipe_list_author': ('recipe_author_id_idx',),
+        'feed': ('unique_feedentry',),
+        'subscriptions': ('unique_follow',),
+        'subscription_recipes': ('recipe_author_id_idx',),
+        'shopping_list': (
+            'unique_shoppinglistitem', 'recipes_shoppinglistitem_user_id'
+        ),
+        'favorite_check': ('unique_favorite',),
+        'recipe_counters': ('recipes_recipe_pkey',),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.reader = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            first_name='Читатель', last_name='Читателев', password='pass'
+        )
+        Follow.objects.create(user=cls.reader, following=cls.author)
+        for recipe in cls.create_recipes(5):
+            FeedEntry.objects.create(user=cls.reader, recipe=recipe)
+            Favorite.objects.create(user=cls.reader, recipe=recipe)
+            ShoppingCart.objects.create(user=cls.reader, recipe=recipe)
+
+    def test_hot_queries_have_no_seq_scans(self):
+        call_command(
+            'explain_queries', user=self.reader.email, stdout=io.StringIO()
+        )
+
+    def test_plans_use_intended_indexes(self):
+        plans = ExplainCommand().explain(connection, self.reader)
+        for name, indexes in self.INDEXES.items():
+            plan = '\n'.join(plans[name])
+            with self.subTest(query=name):
+                self.assertTrue(
+                    any(index in plan for index in indexes), plan
+                )
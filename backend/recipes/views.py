@@ -1,59 +1,171 @@
-import io
+import os
+from collections import defaultdict
 
-from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import transaction
-from django.db.models import Count, Exists, OuterRef, Subquery, Value
+from django.db import connection, transaction
+from django.db.models import (Count, Exists, F, Max, OuterRef, Subquery, Value,
+                              Window)
+from django.db.models.functions import RowNumber
 from django.http import FileResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.units import inch
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.generics import get_object_or_404
-from rest_framework.permissions import AllowAny, IsAuthenticatedOrReadOnly
+from rest_framework.permissions import (AllowAny, IsAuthenticated,
+                                        IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
+from tasks.models import Task
 
+from .cache import get_generation
+from .counters import change_counter
+from .exporters import EXPORTERS, IgnoreFormatContentNegotiation, shopping_list
+from .feed import feed_filter
 from .filters import RecipeFilter
-from .models import (Favorite, Follow, Ingredient, Recipe, RecipeIngredient,
-                     ShoppingCart, Tag)
-from .pagination import LimitPagination
+from .ingredient_index import ingredient_index
+from .mixins import ConditionalGetMixin
+from .models import Favorite, Follow, Ingredient, Recipe, ShoppingCart, Tag
+from .pagination import LimitCursorPagination, LimitOrCursorPagination
 from .permissions import IsAuthorOrReadOnly
-from .serializers import (FollowSerialiser, IngredientSerialiser,
+from .serializers import (ExportSerializer, FollowSerialiser,
+                          IngredientSerialiser, RecipeBatchSerializer,
                           RecipeCUDSerializer, RecipeFavSerializer,
                           RecipeRSerializer, SpecialUserSerializer,
                           TagSerializer)
+from .shopping_totals import shift_totals, table
+from .tasks import export_shopping_list
 
 User = get_user_model()
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+def latest_recipes(author_ids, limit=None):
+    """Запрос последних рецептов авторов.
+
+    При заданном limit рецепты каждого автора нумеруются оконной
+    функцией ROW_NUMBER() OVER (PARTITION BY author) и от каждого
+    автора остаются первые limit записей.
+    """
+    recipes = Recipe.objects.filter(author_id__in=author_ids).only(
+        'id', 'name', 'image', 'thumbnail', 'thumbnail_webp',
+        'cooking_time', 'author_id'
+    )
+    if limit:
+        ranked = recipes.annotate(
+            recipe_rank=Window(
+                expression=RowNumber(),
+                partition_by=F('author_id'),
+                order_by=F('id').desc()
+            )
+        )
+        sql, params = ranked.query.sql_with_params()
+        recipes = Recipe.objects.raw(
+            f'SELECT * FROM ({sql}) AS ranked '
+            'WHERE ranked.recipe_rank <= %s '
+            'ORDER BY ranked.recipe_rank',
+            (*params, limit)
+        )
+    return recipes
+
+
+def latest_recipes_by_author(author_ids, limit=None):
+    """Последние рецепты авторов одним запросом, по id автора."""
+    recipes_by_author = defaultdict(list)
+    for recipe in latest_recipes(author_ids, limit):
+        recipes_by_author[recipe.author_id].append(recipe)
+    return recipes_by_author
+
+
+def insert_user_recipes(model, user_id, recipe_ids):
+    """Добавляет рецепты в избранное/корзину одним INSERT.
+
+    Несуществующие рецепты и уже добавленные строки пропускаются
+    в том же запросе. Возвращает id рецептов, строки которых
+    вставил этот запрос, а не параллельный.
+    """
+    if not recipe_ids:
+        return []
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table(model)} (user_id, recipe_id) '
+            f'SELECT %s, recipe.id FROM {table(Recipe)} AS recipe '
+            f'WHERE recipe.id IN ({placeholders}) '
+            'ON CONFLICT (user_id, recipe_id) DO NOTHING '
+            'RETURNING recipe_id',
+            [user_id, *recipe_ids]
+        )
+        return [recipe_id for recipe_id, in cursor.fetchall()]
+
+
+def delete_user_recipes(model, user_id, recipe_ids):
+    """Удаляет рецепты из избранного/корзины одним DELETE.
+
+    Запрос идёт в обход QuerySet.delete(): сигналы pre_delete
+    и post_delete обновили бы счётчики и список покупок отдельным
+    запросом на каждую строку. Возвращает id удалённых рецептов.
+    """
+    if not recipe_ids:
+        return []
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table(model)} '
+            f'WHERE user_id = %s AND recipe_id IN ({placeholders}) '
+            'RETURNING recipe_id',
+            [user_id, *recipe_ids]
+        )
+        return [recipe_id for recipe_id, in cursor.fetchall()]
+
+
+class TagViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
     http_method_names = ['get', 'head', 'options']
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ConditionalGetMixin,
+                        viewsets.ReadOnlyModelViewSet):
+    queryset = Ingredient.objects.all()
     serializer_class = IngredientSerialiser
     pagination_class = None
     http_method_names = ['get', 'head', 'options']
 
-    def get_queryset(self):
-        if self.request.query_params.get('name'):
-            return Ingredient.objects.filter(
-                name__startswith=self.request.query_params.get('name')
-            )
-        return Ingredient.objects.all()
+    def get_version(self):
+        """Версия поиска по названию берётся из индекса, без запроса.
+
+        Версия читается до поиска: если индекс перестроится между
+        ними, клиент получит новые данные со старым ETag и при
+        следующем запросе просто загрузит их заново.
+        """
+        if self.action != 'list' or not self.request.query_params.get('name'):
+            return super().get_version()
+        count, updated_at = ingredient_index.version()
+        if not count:
+            return None
+        return (
+            f'{self.basename}-search-{count}-{updated_at.timestamp()}'
+            f'{self.get_query_version()}',
+            updated_at
+        )
+
+    def list(self, request, *args, **kwargs):
+        if not request.query_params.get('name'):
+            return super().list(request, *args, **kwargs)
+        return self.conditional_response(
+            self.search, request, *args, **kwargs
+        )
+
+    def search(self, request, *args, **kwargs):
+        serializer = self.get_serializer(
+            ingredient_index.search(request.query_params['name']), many=True
+        )
+        return Response(serializer.data)
 
 
 class SpecialUserViewSet(UserViewSet):
     permission_classes = (IsAuthenticatedOrReadOnly,)
-    pagination_class = LimitPagination
+    pagination_class = LimitOrCursorPagination
 
     def get_queryset(self):
         if self.get_instance().is_authenticated:
@@ -63,12 +175,17 @@ class SpecialUserViewSet(UserViewSet):
                     user.recipes_follow_related.filter(
                         following=OuterRef('id')
                     )
-                ),
-                recipes_count=Count('recipes_author'),
+                )
             )
             return queryset
         return User.objects.annotate(is_subscribed=Value(False))
 
+    def get_recipes_limit(self):
+        limit = self.request.query_params.get('recipes_limit')
+        if limit and limit.isdigit() and int(limit) > 0:
+            return int(limit)
+        return None
+
     @action(
         detail=True,
         methods=['post', 'delete'],
@@ -81,7 +198,10 @@ class SpecialUserViewSet(UserViewSet):
             serializer = FollowSerialiser(
                 author,
                 data=request.data,
-                context={'request': request}
+                context={
+                    'request': request,
+                    'recipes_limit': self.get_recipes_limit()
+                }
             )
             serializer.is_valid(raise_exception=True)
             Follow.objects.create(user=user, following=author)
@@ -103,9 +223,16 @@ class SpecialUserViewSet(UserViewSet):
         user = request.user
         queryset = self.get_queryset().filter(followers__user=user)
         pages = self.paginate_queryset(queryset)
+        recipes_limit = self.get_recipes_limit()
         serializer = FollowSerialiser(
             pages, many=True,
-            context={'request': request}
+            context={
+                'request': request,
+                'recipes_limit': recipes_limit,
+                'recipes_by_author': latest_recipes_by_author(
+                    [author.id for author in pages], recipes_limit
+                )
+            }
         )
         return self.get_paginated_response(serializer.data)
 
@@ -122,16 +249,21 @@ class SpecialUserViewSet(UserViewSet):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
-    pagination_class = LimitPagination
+class RecipeViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    pagination_class = LimitOrCursorPagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     permission_classes = (IsAuthenticatedOrReadOnly,)
+    vary_on_user = True
+    version_lookups = ('author',)
 
     def get_queryset(self):
         user = self.request.user
+        recipes = Recipe.objects.select_related('author').defer(
+            'search_vector'
+        )
         if user.is_authenticated:
-            queryset = Recipe.objects.annotate(
+            return recipes.annotate(
                 is_favorited=Exists(
                     user.recipes_favorite_related.filter(
                         recipe=OuterRef('id'))
@@ -139,18 +271,107 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 is_in_shopping_cart=Exists(
                     user.recipes_shoppingcart_related.filter(
                         recipe=OuterRef('id'))
+                ),
+                author_is_subscribed=Exists(
+                    user.recipes_follow_related.filter(
+                        following=OuterRef('author_id'))
                 )
             )
-            return queryset
-
-        return Recipe.objects.annotate(
+        return recipes.annotate(
             is_favorited=Value(False),
-            is_in_shopping_cart=Value(False)
+            is_in_shopping_cart=Value(False),
+            author_is_subscribed=Value(False)
+        )
+
+    def get_version(self):
+        """Версия рецепта с автором, тегами, ингредиентами и флагами.
+
+        Вычисляется одним запросом без загрузки связанных объектов.
+        """
+        if self.action == 'list':
+            return self.get_list_version()
+        if self.action != 'retrieve':
+            return None
+        try:
+            recipes = self.get_queryset().filter(pk=self.kwargs['pk'])
+        except (TypeError, ValueError):
+            return None
+        version = recipes.annotate(
+            tags_updated_at=Subquery(
+                Tag.objects.filter(
+                    tags_recipe=OuterRef('pk')
+                ).order_by('-updated_at').values('updated_at')[:1]
+            ),
+            ingredients_updated_at=Subquery(
+                Ingredient.objects.filter(
+                    recipes=OuterRef('pk')
+                ).order_by('-updated_at').values('updated_at')[:1]
+            )
+        ).values_list(
+            'updated_at', 'author__updated_at', 'tags_updated_at',
+            'ingredients_updated_at', 'is_favorited', 'is_in_shopping_cart',
+            'author_is_subscribed'
+        ).first()
+        if version is None:
+            return None
+        dates, flags = version[:4], version[4:]
+        return (
+            'recipe-' + '-'.join(
+                [str(date.timestamp() if date else 0) for date in dates]
+                + [str(int(flag)) for flag in flags]
+            ),
+            max(filter(None, dates))
+        )
+
+    def get_list_version(self):
+        """Версия страницы списка рецептов с учётом фильтров.
+
+        Изменение тегов и ингредиентов учитывается поколением кэша
+        представлений, которое сбрасывается при их сохранении:
+        максимум updated_at по всем связям выборки обошёлся бы
+        в соединение рецептов с тегами и ингредиентами.
+
+        Флаги is_favorited, is_in_shopping_cart и is_subscribed
+        не меняют updated_at рецептов, поэтому для пользователя
+        в версию входят число и наибольший id его строк избранного,
+        корзины и подписок - ещё один запрос из подзапросов.
+        """
+        version = super().get_version()
+        if version is None:
+            return None
+        etag, last_modified = version
+        etag = f'{etag}-{get_generation()}'
+        user = self.request.user
+        if not user.is_authenticated:
+            return etag, last_modified
+        flags = User.objects.filter(pk=user.pk).annotate(**{
+            f'{name}_{function.name.lower()}': Subquery(
+                model.objects.filter(
+                    user=OuterRef('pk')
+                ).order_by().values('user').annotate(
+                    value=function('id')
+                ).values('value')
+            )
+            for name, model in (
+                ('favorites', Favorite),
+                ('cart', ShoppingCart),
+                ('follows', Follow),
+            )
+            for function in (Count, Max)
+        }).values_list(
+            'favorites_count', 'favorites_max', 'cart_count', 'cart_max',
+            'follows_count', 'follows_max'
+        ).first()
+        return (
+            etag + '-' + '-'.join(str(flag or 0) for flag in flags),
+            last_modified
         )
 
     def get_permissions(self):
         if self.action == 'list' or self.action == 'retrive':
             return (AllowAny(),)
+        if self.action in ('feed', 'download_shopping_cart'):
+            return (IsAuthenticated(),)
         if (self.action == 'destroy'
                 or self.action == 'update'
                 or self.action == 'partial_update'):
@@ -218,38 +439,124 @@ class RecipeViewSet(viewsets.ModelViewSet):
     @action(
         detail=False,
     )
+    def feed(self, request):
+        """Рецепты авторов из подписок, новые первыми, по курсору."""
+        queryset = self.get_queryset().filter(feed_filter(request.user))
+        paginator = LimitCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = RecipeRSerializer(
+            page, many=True, context=self.get_serializer_context()
+        )
+        return paginator.get_paginated_response(serializer.data)
+
     @transaction.atomic
+    def batch_models(self, request, model):
+        """Пакетно добавляет или удаляет рецепты избранного/корзины.
+
+        Запись идёт одним INSERT или одним DELETE в транзакции,
+        результат для каждого переданного id берётся из RETURNING,
+        то есть из строк, которые изменил именно этот запрос.
+        """
+        serializer = RecipeBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(serializer.validated_data['recipes']))
+        user_rows = model.objects.filter(user=request.user, recipe_id__in=ids)
+        if request.method == 'POST':
+            changed = insert_user_recipes(model, request.user.id, ids)
+            if model is ShoppingCart:
+                shift_totals(changed, 1, user_id=request.user.id)
+            outcomes = {
+                pk: 'exists'
+                for pk in user_rows.values_list('recipe_id', flat=True)
+            }
+            outcomes.update({pk: 'added' for pk in changed})
+            change_counter(model, changed, 1)
+        else:
+            # Строки блокируются до конца транзакции: состав корзины
+            # вычитается из списка покупок ровно для удаляемых строк.
+            present = list(
+                user_rows.select_for_update().values_list(
+                    'recipe_id', flat=True
+                )
+            )
+            if model is ShoppingCart:
+                shift_totals(present, -1, user_id=request.user.id)
+            changed = delete_user_recipes(model, request.user.id, present)
+            outcomes = {pk: 'removed' for pk in changed}
+            change_counter(model, changed, -1)
+        return Response({
+            'recipes': [
+                {'id': pk, 'status': outcomes.get(pk, 'not_found')}
+                for pk in ids
+            ]
+        })
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='favorite/batch',
+    )
+    def favorite_batch(self, request):
+        return self.batch_models(request, Favorite)
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='shopping_cart/batch',
+    )
+    def shopping_cart_batch(self, request):
+        return self.batch_models(request, ShoppingCart)
+
+    @action(
+        detail=False,
+        content_negotiation_class=IgnoreFormatContentNegotiation,
+    )
     def download_shopping_cart(self, request):
-        buf = io.BytesIO()
-        c = canvas.Canvas(buf, pagesize=letter, bottomup=0)
-        textob = c.beginText()
-        textob.setTextOrigin(inch, inch)
-        pdfmetrics.registerFont(TTFont(
-            'DejaVuSerif', 'DejaVuSerif.ttf')
-        )
-        textob.setFont('DejaVuSerif', settings.FONT_SIZE)
-        user = self.request.user
-        lines = {}
-        recipes_cart = user.recipes_shoppingcart_related.all()
-        ingredients_cart = RecipeIngredient.objects.filter(
-            recipes=Subquery(recipes_cart.values('id'))
-        ).select_related('ingredients')
-        for ingredient in ingredients_cart:
-            amount = ingredient.amount
-            dick_key = (f'{ingredient.ingredients.name} -- '
-                        f'{ingredient.ingredients.measurement_unit}')
-            if dick_key in lines:
-                lines[dick_key] += amount
-            else:
-                lines[dick_key] = amount
-        for key, value in lines.items():
-            textob.textLine(f'{key}--{value}')
-        c.drawText(textob)
-        c.showPage
-        c.save()
-        buf.seek(0)
+        export_format = request.query_params.get('format', 'pdf')
+        if export_format not in EXPORTERS:
+            return Response(
+                f'Неизвестный формат {export_format}. '
+                f'Доступные форматы: {", ".join(EXPORTERS)}.',
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if request.query_params.get('async') in ('1', 'true'):
+            export = export_shopping_list.delay(
+                user=request.user, export_format=export_format
+            )
+            return Response(
+                ExportSerializer(export, context={'request': request}).data,
+                status=status.HTTP_202_ACCEPTED
+            )
+        return EXPORTERS[export_format](
+            shopping_list(request.user).iterator()
+        ).get_response()
+
+
+class ExportViewSet(viewsets.ReadOnlyModelViewSet):
+    """Статус и файлы фоновых выгрузок списка покупок пользователя.
+
+    Файлы хранятся вне media и отдаются только их владельцу.
+    """
+    serializer_class = ExportSerializer
+    permission_classes = (IsAuthenticated,)
+    pagination_class = None
+
+    def get_queryset(self):
+        return Task.objects.filter(
+            user=self.request.user,
+            name=export_shopping_list.task_name
+        )
+
+    @action(detail=True)
+    def download(self, request, pk):
+        export = self.get_object()
+        if export.status != Task.DONE or not export.result:
+            return Response(
+                'Выгрузка ещё не готова.',
+                status=status.HTTP_404_NOT_FOUND
+            )
         return FileResponse(
-            buf,
+            export.result.open('rb'),
             as_attachment=True,
-            filename='cart.pdf',
+            filename=os.path.basename(export.result.name)
         )
@@ -0,0 +1,20 @@
+from django.contrib import admin
+
+from .models import Task
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    """Класс настройки фоновых задач."""
+
+    list_display = (
+        'id',
+        'name',
+        'status',
+        'user',
+        'attempts',
+        'created_at',
+        'finished_at',
+    )
+    list_filter = ('status', 'name')
+    readonly_fields = ('started_at', 'finished_at', 'attempts')
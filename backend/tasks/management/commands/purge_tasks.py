@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from tasks.queue import purge
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет завершённые задачи старше TASKS_RESULT_TTL вместе '
+        'с файлами выгрузок. Для TASKS_BACKEND=local запускается по cron.'
+    )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Удалено задач: {purge()}.')
@@ -0,0 +1,36 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from tasks.queue import purge, run
+
+
+class Command(BaseCommand):
+    help = 'Выполняет фоновые задачи из очереди в базе данных.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Выполнить все задачи из очереди и завершиться.'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Обработчик задач запущен.')
+        purged_at = None
+        while True:
+            close_old_connections()
+            task = run()
+            if task is not None:
+                self.stdout.write(f'{task.name} #{task.pk} обработана.')
+                continue
+            if (purged_at is None or time.monotonic() - purged_at
+                    > settings.TASKS_PURGE_INTERVAL):
+                purged = purge()
+                if purged:
+                    self.stdout.write(f'Удалено старых задач: {purged}.')
+                purged_at = time.monotonic()
+            if options['once']:
+                return
+            time.sleep(settings.TASKS_POLL_INTERVAL)
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.3 on 2026-10-18 18:44
+
+from django.db import migrations, models
+import tasks.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='task',
+            name='result',
+            field=models.FileField(blank=True, storage=tasks.models.private_storage, upload_to=tasks.models.result_path, verbose_name='Результат'),
+        ),
+    ]
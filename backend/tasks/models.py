@@ -0,0 +1,90 @@
+import uuid
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import models
+
+
+def private_storage():
+    """Хранилище результатов: не раздаётся nginx вместе с media."""
+    return FileSystemStorage(location=settings.PRIVATE_MEDIA_ROOT)
+
+
+def result_path(instance, filename):
+    """Каждый результат - в своём каталоге со случайным именем."""
+    return f'exports/{uuid.uuid4().hex}/{filename}'
+
+
+class Task(models.Model):
+    """Фоновая задача в очереди."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField(
+        'Задача',
+        max_length=settings.LETTERS_IN_FIELD
+    )
+    payload = models.JSONField(
+        'Аргументы',
+        default=dict
+    )
+    status = models.CharField(
+        'Статус',
+        max_length=settings.LETTERS_IN_STATUS,
+        choices=STATUSES,
+        default=PENDING
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='tasks'
+    )
+    result = models.FileField(
+        'Результат',
+        upload_to=result_path,
+        storage=private_storage,
+        blank=True
+    )
+    error = models.TextField(
+        'Ошибка',
+        blank=True
+    )
+    attempts = models.PositiveSmallIntegerField(
+        'Попыток',
+        default=0
+    )
+    created_at = models.DateTimeField(
+        'Создана',
+        auto_now_add=True
+    )
+    started_at = models.DateTimeField(
+        'Начата',
+        null=True,
+        blank=True
+    )
+    finished_at = models.DateTimeField(
+        'Завершена',
+        null=True,
+        blank=True
+    )
+
+    class Meta:
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        ordering = ('id',)
+        indexes = [
+            models.Index(fields=['status', 'id'], name='task_status_id_idx')
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} ({self.status})'
@@ -0,0 +1,146 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from foodgram.db_router import primary
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+def task(func):
+    """Регистрирует функцию как фоновую задачу.
+
+    Функция получает объект Task и аргументы из payload,
+    поставить её в очередь можно через func.delay(user=..., **payload).
+    """
+    name = f'{func.__module__}.{func.__name__}'
+    _registry[name] = func
+
+    def delay(user=None, **payload):
+        return enqueue(name, user=user, **payload)
+
+    func.task_name = name
+    func.delay = delay
+    return func
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(
+        max_workers=settings.TASKS_LOCAL_WORKERS,
+        thread_name_prefix='tasks'
+    )
+
+
+def enqueue(name, user=None, **payload):
+    """Создаёт задачу, выполнение начинается после коммита транзакции."""
+    task = Task.objects.create(name=name, user=user, payload=payload)
+    if settings.TASKS_BACKEND == 'local':
+        transaction.on_commit(
+            lambda: get_executor().submit(run_in_thread, task.pk)
+        )
+    elif settings.TASKS_BACKEND == 'eager':
+        transaction.on_commit(lambda: run(task.pk))
+    return task
+
+
+def claim(task_id=None):
+    """Переводит задачу из очереди в работу, None - если её уже взяли.
+
+    Задача в статусе running дольше TASKS_LEASE_SECONDS осталась
+    от упавшего воркера: она берётся снова, а исчерпавшая
+    TASKS_MAX_ATTEMPTS попыток помечается ошибкой.
+    """
+    now = timezone.now()
+    expired = Q(
+        status=Task.RUNNING,
+        started_at__lt=now - timedelta(seconds=settings.TASKS_LEASE_SECONDS)
+    )
+    Task.objects.filter(
+        expired, attempts__gte=settings.TASKS_MAX_ATTEMPTS
+    ).update(
+        status=Task.FAILED,
+        error='Истекло время выполнения.',
+        finished_at=now
+    )
+    with transaction.atomic():
+        tasks = Task.objects.select_for_update(skip_locked=True).filter(
+            Q(status=Task.PENDING) | expired
+        )
+        if task_id is not None:
+            tasks = tasks.filter(pk=task_id)
+        task = tasks.order_by('id').first()
+        if task is None:
+            return None
+        Task.objects.filter(pk=task.pk).update(
+            status=Task.RUNNING,
+            started_at=now,
+            attempts=F('attempts') + 1
+        )
+    task.status = Task.RUNNING
+    return task
+
+
+def execute(task):
+    try:
+        _registry[task.name](task, **task.payload)
+    except Exception as error:
+        logger.exception('Задача %s #%s завершилась ошибкой',
+                         task.name, task.pk)
+        Task.objects.filter(pk=task.pk).update(
+            status=Task.FAILED,
+            error=repr(error),
+            finished_at=timezone.now()
+        )
+    else:
+        Task.objects.filter(pk=task.pk).update(
+            status=Task.DONE,
+            finished_at=timezone.now()
+        )
+
+
+def run(task_id=None):
+    """Выполняет задачу task_id или первую задачу из очереди.
+
+    Возвращает выполненную задачу или None, если очередь пуста.
+    Задача читает только основную базу, даже запущенная из запроса.
+    """
+    with primary():
+        task = claim(task_id)
+        if task is not None:
+            execute(task)
+    return task
+
+
+def purge():
+    """Удаляет завершённые задачи старше TASKS_RESULT_TTL с их файлами.
+
+    Возвращает число удалённых задач.
+    """
+    tasks = Task.objects.filter(
+        status__in=(Task.DONE, Task.FAILED),
+        finished_at__lt=timezone.now() - timedelta(
+            seconds=settings.TASKS_RESULT_TTL
+        )
+    )
+    for task in tasks.exclude(result='').only('result').iterator():
+        task.result.delete(save=False)
+    purged, _ = tasks.delete()
+    return purged
+
+
+def run_in_thread(task_id):
+    close_old_connections()
+    try:
+        run(task_id)
+    finally:
+        close_old_connections()
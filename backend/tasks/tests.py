@@ -0,0 +1,80 @@
+import io
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .models import Task
+from .queue import claim
+
+
+@override_settings(TASKS_LEASE_SECONDS=60, TASKS_MAX_ATTEMPTS=2)
+class ClaimLeaseTest(TestCase):
+
+    def create_running(self, started_ago, attempts=1):
+        return Task.objects.create(
+            name='tasks.tests.noop',
+            status=Task.RUNNING,
+            attempts=attempts,
+            started_at=timezone.now() - timedelta(seconds=started_ago)
+        )
+
+    def test_running_task_within_lease_is_not_claimed(self):
+        self.create_running(started_ago=30)
+        self.assertIsNone(claim())
+
+    def test_expired_running_task_is_claimed_again(self):
+        task = self.create_running(started_ago=120)
+        self.assertEqual(claim(), task)
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.RUNNING)
+        self.assertEqual(task.attempts, 2)
+        self.assertIsNone(claim())
+
+    def test_expired_task_out_of_attempts_fails(self):
+        task = self.create_running(started_ago=120, attempts=2)
+        self.assertIsNone(claim())
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.FAILED)
+
+
+@override_settings(TASKS_RESULT_TTL=60)
+class PurgeTest(TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        storage = Task._meta.get_field('result').storage
+        patcher = mock.patch.object(storage, 'location', directory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_task(self, status, finished_ago=None):
+        task = Task.objects.create(name='tasks.tests.noop', status=status)
+        if finished_ago is not None:
+            task.finished_at = timezone.now() - timedelta(
+                seconds=finished_ago
+            )
+        task.result.save('list.csv', ContentFile(b'data'))
+        return task
+
+    def test_old_finished_tasks_are_purged_with_files(self):
+        old = self.create_task(Task.DONE, finished_ago=120)
+        failed = self.create_task(Task.FAILED, finished_ago=120)
+        recent = self.create_task(Task.DONE, finished_ago=30)
+        pending = self.create_task(Task.PENDING)
+        output = io.StringIO()
+        call_command('purge_tasks', stdout=output)
+        self.assertIn('2', output.getvalue())
+        self.assertEqual(
+            set(Task.objects.all()), {recent, pending}
+        )
+        storage = old.result.storage
+        self.assertFalse(storage.exists(old.result.name))
+        self.assertFalse(storage.exists(failed.result.name))
+        self.assertTrue(storage.exists(recent.result.name))
@@ -19,6 +19,8 @@ class MyUserAdmin(UserAdmin):
         'last_name',
         'is_staff',
         'is_superuser',
+        'recipes_count',
+        'followers_count',
     )
     list_editable = ('is_staff',)
     list_filter = ('username',)
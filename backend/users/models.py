@@ -27,6 +27,22 @@ class MyUser(AbstractUser):
         max_length=settings.LETTERS_IN_USERS_FIELD,
         verbose_name='Фамилия'
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество рецептов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество подписчиков'
+    )
+    # Версия данных автора в представлении рецепта: входит в ETag
+    # и ключ кэша рецептов.
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
 
     class Meta:
         verbose_name = 'Пользователь'